@@ -0,0 +1,117 @@
+"""Sync vs async request throughput.
+
+Serves the same product listing through the async router in routers/products.py
+and through an equivalent sync ``def`` handler on a plain Session (how every
+router worked before), drives both in-process over ASGI at a fixed concurrency
+and reports requests/sec with p50/p99 latency.
+
+Run from the project root:
+    python -m benchmarks.bench_async --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session, joinedload, sessionmaker
+
+from benchmarks.common import build_app, create_database, open_database, seed_catalog
+from cache import catalog_cache, NullBackend
+from database import create_db_engine
+import routers.products as products
+import models
+
+
+def build_sync_app(db_path: str):
+    engine = create_db_engine(f"sqlite:///{db_path}")
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.get("/products/")
+    def list_products(db: Session = Depends(get_db)):
+        rows = db.query(models.Product).options(joinedload(models.Product.category)) \
+            .order_by(models.Product.id).limit(50).all()
+        return {"items": products.serialize_products(rows), "next_cursor": None}
+
+    return app, engine
+
+
+def build_async_app(db_path: str):
+    engine, session_factory = open_database(db_path)
+    return build_app(session_factory, products.router), engine
+
+
+async def load(app, n_requests: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with slots:
+                start = time.perf_counter()
+                response = await client.get("/products/", params={"limit": 50})
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+
+        await asyncio.gather(*(one() for _ in range(concurrency)))  # warm up the pools
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": n_requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+    }
+
+
+def main():
+    # Compare the database path, not the catalog cache
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        engine = create_database(db_path)
+        seed_catalog(engine, args.products)
+        engine.dispose()
+        print(f"{args.requests} x GET /products/?limit=50 at concurrency {args.concurrency}\n")
+        print(f"{'handlers':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+
+        sync_app, sync_engine = build_sync_app(db_path)
+        r = asyncio.run(load(sync_app, args.requests, args.concurrency))
+        sync_engine.dispose()
+        print(f"{'sync':<10}{r['rps']:>10.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}")
+
+        async def run_async():
+            app, engine = build_async_app(db_path)
+            try:
+                return await load(app, args.requests, args.concurrency)
+            finally:
+                await engine.dispose()
+
+        r = asyncio.run(run_async())
+        print(f"{'async':<10}{r['rps']:>10.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
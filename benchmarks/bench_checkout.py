@@ -0,0 +1,118 @@
+"""Concurrent checkout stress test.
+
+Fires parallel checkouts at a single product with less stock than there are
+buyers, once through checkout.place_order and once through the previous
+read-check-decrement implementation, and reports units sold versus stock and
+checkouts per second. Exits 1 if place_order oversells; the legacy
+implementation is expected to.
+
+Run from the project root:
+    python -m benchmarks.bench_checkout --buyers 200 --stock 50 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import create_database, open_database, seed_buyers, seed_catalog
+from checkout import place_order
+from routers.cart import CART_ITEMS_WITH_PRODUCTS
+import models
+
+
+async def legacy_checkout(db, cart):
+    # The pre-transactional implementation: stock checked and decremented in
+    # Python, then three separate commits.
+    total = 0
+    for item in cart.items:
+        if item.product.remaining_units < item.quantity:
+            raise HTTPException(status_code=400, detail="Not enough stock")
+        item.product.remaining_units -= item.quantity
+        total += item.product.price * item.quantity
+    order_cart = models.Cart(user_id=cart.user_id, is_checked_out=True)
+    db.add(order_cart)
+    await db.commit()
+    for item in cart.items:
+        db.add(models.CartItem(cart_id=order_cart.id, product_id=item.product_id, quantity=item.quantity))
+    await db.commit()
+    order = models.Order(user_id=cart.user_id, cart_id=order_cart.id, total_amount=total)
+    cart.is_checked_out = True
+    db.add(order)
+    await db.commit()
+    return order
+
+
+def seed(db_path: str, buyers: int, stock: int):
+    engine = create_database(db_path)
+    seed_catalog(engine, 1, name="Flash Sale Item", price=100,
+                 total_units=stock, remaining_units=stock, quantity=stock)
+    cart_ids = seed_buyers(engine, buyers, items={1: 1})
+    engine.dispose()
+    return 1, cart_ids
+
+
+async def run(checkout_fn, buyers: int, stock: int, concurrency: int, tuned: bool):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        product_id, cart_ids = seed(db_path, buyers, stock)
+        engine, SessionLocal = open_database(db_path, tuned=tuned, pool_size=concurrency)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def checkout(cart_id):
+            async with slots, SessionLocal() as db:
+                cart = await db.scalar(
+                    select(models.Cart).options(CART_ITEMS_WITH_PRODUCTS).where(models.Cart.id == cart_id)
+                )
+                try:
+                    await checkout_fn(db, cart)
+                    return "ok"
+                except HTTPException:
+                    return "rejected"
+                except OperationalError:
+                    return "error"
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(checkout(cart_id) for cart_id in cart_ids))
+        elapsed = time.perf_counter() - start
+
+        async with SessionLocal() as db:
+            remaining = await db.scalar(
+                select(models.Product.remaining_units).where(models.Product.id == product_id)
+            )
+            orders = await db.scalar(select(func.count(models.Order.id)))
+        await engine.dispose()
+        return {
+            "orders": orders,
+            "rejected": results.count("rejected"),
+            "errors": results.count("error"),
+            "remaining": remaining,
+            "oversold": max(0, orders - stock),
+            "per_sec": buyers / elapsed,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--untuned", action="store_true", help="disable the SQLite WAL/pragma tuning")
+    args = parser.parse_args()
+
+    print(f"{args.buyers} buyers, {args.stock} units, {args.concurrency} concurrent checkouts\n")
+    print(f"{'implementation':<16}{'orders':>8}{'rejected':>10}{'errors':>8}{'remaining':>11}{'oversold':>10}{'checkouts/s':>13}")
+    results = {}
+    for name, fn in (("legacy", legacy_checkout), ("place_order", place_order)):
+        r = results[name] = asyncio.run(run(fn, args.buyers, args.stock, args.concurrency, tuned=not args.untuned))
+        print(f"{name:<16}{r['orders']:>8}{r['rejected']:>10}{r['errors']:>8}{r['remaining']:>11}{r['oversold']:>10}{r['per_sec']:>13.0f}")
+    sys.exit(1 if results["place_order"]["oversold"] else 0)
+
+
+if __name__ == "__main__":
+    main()
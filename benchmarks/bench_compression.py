@@ -0,0 +1,125 @@
+"""Response compression: CPU time vs bytes saved, per coding and level, at several catalog sizes.
+
+Builds GET /products/ style payloads (orjson, the ProductOut shape) of
+--sizes products each and, for every coding installed here (gzip always; br
+and zstd when brotli / zstandard are importable) at a few levels, reports the
+compressed size, the ratio and the time to compress one response. Then it
+serves a --serve-size payload (by default the listing's largest page)
+through CompressionMiddleware over ASGI and reports requests/sec with and
+without compression: the whole per-request cost, middleware included.
+
+Run from the project root:
+    python -m benchmarks.bench_compression --sizes 10 50 200 5000
+"""
+import argparse
+import asyncio
+import time
+import zlib
+
+import httpx
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+import compression
+from compression import CompressionMiddleware, brotli, zstandard
+
+WORDS = ("red", "blue", "steel", "cotton", "wireless", "compact", "classic", "pro", "mini", "smart")
+
+
+def product_page(size: int):
+    items = [
+        {
+            "name": f"{WORDS[p % 10].title()} {WORDS[p * 7 % 10]} item {p}",
+            "description": " ".join(WORDS[(p + k) * 3 % 10] for k in range(6)),
+            "price": round(1 + p * 37 % 49900 / 100, 2),
+            "category_id": 1 + p % 50,
+            "id": p,
+            "category": {"name": f"Category {1 + p % 50}", "description": f"Generated category {1 + p % 50}",
+                         "id": 1 + p % 50},
+            "stock_status": "Available" if p % 13 else "Out of Stock",
+            "quantity": p % 100,
+        }
+        for p in range(1, size + 1)
+    ]
+    return orjson.dumps({"items": items, "next_cursor": size if size else None})
+
+
+def codecs():
+    yield "gzip", 1, lambda body: zlib.compress(body, 1, wbits=31)
+    yield "gzip", 6, lambda body: zlib.compress(body, 6, wbits=31)
+    yield "gzip", 9, lambda body: zlib.compress(body, 9, wbits=31)
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            yield "br", quality, lambda body, q=quality: brotli.compress(body, quality=q)
+    if zstandard is not None:
+        for level in (1, 3, 9):
+            yield "zstd", level, zstandard.ZstdCompressor(level=level).compress
+
+
+def time_per_call(fn, body, min_seconds: float = 0.2):
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(body)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+async def requests_per_second(app, requests: int, concurrency: int, accept_encoding: str):
+    remaining = iter(range(requests))
+    sent = 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            nonlocal sent
+            for _ in remaining:
+                response = await client.get("/", headers={"accept-encoding": accept_encoding})
+                sent = int(response.headers["content-length"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start), sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 5000], help="products per response")
+    parser.add_argument("--serve-size", type=int, default=200, help="products in the served response")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    missing = [name for name, module in (("brotli", brotli), ("zstandard", zstandard)) if module is None]
+    if missing:
+        print(f"Not installed, skipped: {', '.join(missing)}\n")
+
+    print(f"{'products':>9}{'coding':>8}{'level':>7}{'bytes':>10}{'ratio':>8}{'compress':>12}{'MB/s':>8}")
+    for size in args.sizes:
+        body = product_page(size)
+        print(f"{size:>9}{'none':>8}{'':>7}{len(body):>10}")
+        for name, level, fn in codecs():
+            compressed = fn(body)
+            seconds = time_per_call(fn, body)
+            print(f"{'':>9}{name:>8}{level:>7}{len(compressed):>10}{len(body) / len(compressed):>7.1f}x"
+                  f"{seconds * 1e6:>10.0f}us{len(body) / seconds / 1e6:>8.0f}")
+
+    size = args.serve_size
+    body = orjson.loads(product_page(size))
+    app = FastAPI()
+    app.add_api_route("/", lambda: ORJSONResponse(body), methods=["GET"])
+    wrapped = CompressionMiddleware(app)
+
+    print(f"\nGET of {size} products through CompressionMiddleware, {args.requests} requests, "
+          f"{args.concurrency} concurrent (min size {compression.COMPRESS_MIN_SIZE} B)")
+    baseline, _ = asyncio.run(requests_per_second(app, args.requests, args.concurrency, "identity"))
+    print(f"{'no middleware':<22}{baseline:>8.0f} req/s")
+    for encoding in ["identity"] + compression.AVAILABLE_ENCODINGS:
+        rate, sent = asyncio.run(requests_per_second(wrapped, args.requests, args.concurrency, encoding))
+        print(f"{'Accept-Encoding: ' + encoding:<22}{rate:>8.0f} req/s {sent:>10} bytes sent")
+
+
+if __name__ == "__main__":
+    main()
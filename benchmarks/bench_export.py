@@ -0,0 +1,150 @@
+"""Memory use of the streaming exports as the tables grow.
+
+Grows a scratch database to each size in --sizes (products and orders alike),
+streams GET /products/export and GET /orders/export in NDJSON and CSV through
+the real routers, calling the ASGI app directly, and samples the process's
+anonymous RSS after every chunk received. The peak RSS above the pre-export baseline must stay flat as the
+table grows; the script exits 1 if it exceeds --max-growth-mb at any size.
+
+Run from the project root:
+    python -m benchmarks.bench_export --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import build_app, create_database, open_database, seed_catalog
+import routers.orders as orders
+import routers.products as products
+import schemas
+
+
+def rss_mb():
+    # Anonymous memory only: SQLite reads the database through mmap, and those
+    # file-backed pages count towards total RSS without being held by the export.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # No /proc: fall back to the high-water mark (KiB on Linux, bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def grow(engine, start: int, end: int):
+    # Generate rows inside SQLite so seeding doesn't inflate this process's memory
+    seq = "WITH RECURSIVE seq(i) AS (SELECT :start UNION ALL SELECT i + 1 FROM seq WHERE i < :end)"
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO products (name, description, price, category_id, total_units, remaining_units, quantity) "
+            f"{seq} SELECT 'Product ' || i, 'bench item ' || i, i % 1000 + 0.99, 1, 10, i % 10, 10 FROM seq"
+        ), {"start": start, "end": end})
+        conn.execute(text(
+            "INSERT INTO orders (user_id, cart_id, total_amount, order_status, order_time) "
+            f"{seq} SELECT 1, i, i % 500 + 0.5, 'confirmed', datetime('now') FROM seq"
+        ), {"start": start, "end": end})
+
+
+async def export(app, path: str, fmt: str):
+    # Drive the ASGI app directly and drop each chunk once counted: httpx's
+    # ASGITransport would buffer the whole body and hide what the server holds.
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "server": ("bench", 80), "client": ("127.0.0.1", 1234), "root_path": "",
+        "path": path, "raw_path": path.encode(), "query_string": f"format={fmt}".encode(), "headers": [],
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()  # never disconnects
+
+    baseline = peak = rss_mb()
+    stats = {"status": None, "lines": 0, "size": 0}
+
+    async def send(message):
+        nonlocal peak
+        if message["type"] == "http.response.start":
+            stats["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            stats["lines"] += chunk.count(b"\n")
+            stats["size"] += len(chunk)
+            peak = max(peak, rss_mb())
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    if stats["status"] != 200:
+        raise SystemExit(f"{path}?format={fmt} returned HTTP {stats['status']}")
+    return {
+        "rows": stats["lines"] - (1 if fmt == "csv" else 0),
+        "mb": stats["size"] / 2**20,
+        "seconds": time.perf_counter() - start,
+        "growth": peak - baseline,
+    }
+
+
+async def run(app, size: int):
+    results = []
+    for path in ("/products/export", "/orders/export"):
+        for fmt in ("ndjson", "csv"):
+            r = await export(app, path, fmt)
+            if r["rows"] != size:
+                raise SystemExit(f"{path}?format={fmt} returned {r['rows']} rows, expected {size}")
+            results.append((f"{path}?format={fmt}", r))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-growth-mb", type=float, default=50)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        engine = create_database(db_path)
+        seed_catalog(engine, 0)
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO users (id, email, password_hash, role) VALUES (1, 'buyer@example.com', '-', 'user')"
+            ))
+
+        print(f"{'rows':>10}  {'export':<32}{'MiB':>8}{'seconds':>9}{'rows/s':>10}{'peak RSS +MiB':>15}")
+        seeded = 0
+        for size in sorted(args.sizes):
+            grow(engine, seeded + 1, size)
+            seeded = size
+
+            async def run_size():
+                async_engine, session_factory = open_database(db_path)
+                admin = schemas.CurrentUser(id=1, email="admin@example.com", role="admin")
+                app = build_app(session_factory, products.router, orders.router, user=admin)
+                try:
+                    return await run(app, size)
+                finally:
+                    await async_engine.dispose()
+
+            for name, r in asyncio.run(run_size()):
+                print(f"{size:>10}  {name:<32}{r['mb']:>8.1f}{r['seconds']:>9.1f}"
+                      f"{r['rows'] / r['seconds']:>10.0f}{r['growth']:>15.1f}")
+                failed = failed or r["growth"] > args.max_growth_mb
+        engine.dispose()
+
+    if failed:
+        raise SystemExit(f"memory grew by more than {args.max_growth_mb} MiB during an export")
+
+
+if __name__ == "__main__":
+    main()
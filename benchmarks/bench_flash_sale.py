@@ -0,0 +1,174 @@
+"""Flash-sale simulation: stock checked at add time vs held for the cart.
+
+--shoppers users rush a product with --units units. Each adds one or two
+units to their cart, browses for up to --think seconds, then checks out, or
+with probability --abandon leaves the cart behind. Run once with the previous
+behaviour (stock compared when adding, taken only at checkout) and once with
+reservations (adding holds the units for --hold-ttl seconds; a sweeper
+releases abandoned holds).
+
+Reports how many shoppers were turned away when adding, how many got to
+checkout and failed there (the failure holds exist to prevent), orders,
+units sold and oversold, units left once holds have expired, and add/checkout
+latency percentiles.
+
+Run from the project root:
+    python -m benchmarks.bench_flash_sale --shoppers 2000 --units 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import select, func
+
+from benchmarks.common import create_database, open_database, seed_buyers, seed_catalog
+from cache import catalog_cache, NullBackend
+from checkout import place_order
+from database import upsert_insert
+from routers.cart import CART_ITEMS_WITH_PRODUCTS, _save_items
+import models
+import reservations
+
+
+async def checked_add(db, cart_id, quantities):
+    # Before reservations: compare with remaining_units, write the line, take nothing
+    for product_id, quantity in quantities.items():
+        remaining = await db.scalar(
+            select(models.Product.remaining_units).where(models.Product.id == product_id)
+        )
+        if remaining < quantity:
+            raise HTTPException(status_code=400, detail="Not enough stock")
+    statement = upsert_insert(db.get_bind(), models.CartItem)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[models.CartItem.cart_id, models.CartItem.product_id],
+        set_={"quantity": models.CartItem.quantity + statement.excluded.quantity}
+    ), [{"cart_id": cart_id, "product_id": p, "quantity": q} for p, q in quantities.items()])
+    await db.commit()
+
+
+async def held_add(db, cart_id, quantities):
+    await _save_items(db, cart_id, quantities, increment=True)
+    await reservations.commit_stock(db)
+
+
+def seed(db_path: str, shoppers: int, units: int):
+    engine = create_database(db_path)
+    seed_catalog(engine, 1, name="Flash Sale Item", price=100, total_units=units, remaining_units=units, quantity=units)
+    cart_ids = seed_buyers(engine, shoppers, email="shopper{}@example.com")
+    engine.dispose()
+    return cart_ids
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+async def simulate(add_fn, args, seed_value):
+    rng = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        cart_ids = seed(db_path, args.shoppers, args.units)
+        engine, SessionLocal = open_database(db_path, pool_size=args.concurrency)
+        reservations.stock_index.forget()
+        slots = asyncio.Semaphore(args.concurrency)
+        add_times, checkout_times = [], []
+        outcomes = []
+
+        async def shopper(cart_id):
+            quantity = rng.choice((1, 1, 2))
+            abandons = rng.random() < args.abandon
+            think = rng.uniform(0, args.think)
+            await asyncio.sleep(rng.uniform(0, args.arrival))
+
+            async with slots, SessionLocal() as db:
+                start = time.perf_counter()
+                try:
+                    await add_fn(db, cart_id, {1: quantity})
+                except HTTPException:
+                    return "turned away"
+                finally:
+                    add_times.append(time.perf_counter() - start)
+            await asyncio.sleep(think)
+            if abandons:
+                return "abandoned"
+
+            async with slots, SessionLocal() as db:
+                start = time.perf_counter()
+                cart = await db.scalar(
+                    select(models.Cart).options(CART_ITEMS_WITH_PRODUCTS).where(models.Cart.id == cart_id)
+                )
+                try:
+                    await place_order(db, cart)
+                    return "ordered"
+                except HTTPException:
+                    return "failed at checkout"
+                finally:
+                    checkout_times.append(time.perf_counter() - start)
+
+        sweeper = asyncio.create_task(reservations.sweep_holds(SessionLocal, interval=args.hold_ttl / 4))
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(shopper(cart_id) for cart_id in cart_ids))
+        elapsed = time.perf_counter() - start
+        # Let every abandoned hold expire and be swept
+        await asyncio.sleep(args.hold_ttl * 1.5)
+        sweeper.cancel()
+
+        async with SessionLocal() as db:
+            remaining = await db.scalar(select(models.Product.remaining_units).where(models.Product.id == 1))
+            sold = await db.scalar(select(func.coalesce(func.sum(models.OrderItem.quantity), 0)))
+        await engine.dispose()
+
+    return {
+        "turned away": outcomes.count("turned away"),
+        "failed at checkout": outcomes.count("failed at checkout"),
+        "orders": outcomes.count("ordered"),
+        "sold": sold,
+        "oversold": max(0, sold - args.units),
+        "left": remaining,
+        "add p50": percentile(add_times, 50) * 1000,
+        "add p99": percentile(add_times, 99) * 1000,
+        "checkout p50": percentile(checkout_times, 50) * 1000,
+        "checkout p99": percentile(checkout_times, 99) * 1000,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shoppers", type=int, default=1000)
+    parser.add_argument("--units", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--arrival", type=float, default=1.0, help="shoppers arrive over this many seconds")
+    parser.add_argument("--think", type=float, default=0.5, help="max seconds between add and checkout")
+    parser.add_argument("--abandon", type=float, default=0.2, help="share of shoppers who never check out")
+    parser.add_argument("--hold-ttl", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    reservations.HOLD_TTL_SECONDS = args.hold_ttl
+
+    print(f"{args.shoppers} shoppers, {args.units} units, {args.abandon:.0%} abandon, "
+          f"hold TTL {args.hold_ttl}s\n")
+    columns = ("turned away", "failed at checkout", "orders", "sold", "oversold", "left",
+               "add p50", "add p99", "checkout p50", "checkout p99")
+    widths = [max(len(column), 7) + 2 for column in columns]
+    print(f"{'':<16}" + "".join(f"{column:>{width}}" for column, width in zip(columns, widths)))
+    for name, add_fn in (("checked at add", checked_add), ("held", held_add)):
+        r = asyncio.run(simulate(add_fn, args, args.seed))
+        print(f"{name:<16}" + "".join(
+            f"{r[column]:>{width - 2}.1f}ms" if column.endswith(("p50", "p99")) else f"{r[column]:>{width}}"
+            for column, width in zip(columns, widths)
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Idempotency-Key check: the same checkout fired in parallel and then retried.
+
+Sends --parallel concurrent POST /cart/checkout/{id} requests carrying one
+Idempotency-Key through the real routers over ASGI, then --retries sequential
+retries of it. Checks that exactly one order was placed and stock was taken
+once, that every retry got the first response back without a statement on the
+products or orders tables, and that reusing the key for another request is
+refused. Also times replays against first-time checkouts.
+
+Run from the project root:
+    python -m benchmarks.bench_idempotency --parallel 50 --retries 200
+"""
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import event, func, select
+
+from benchmarks.common import build_app, create_database, open_database, seed_buyers, seed_catalog
+from cache import catalog_cache, NullBackend
+from routers.auth import create_token, token_cache
+import routers.cart as cart
+import routers.orders as orders
+import models
+
+STOCK = 1000
+_TOUCHES_STOCK_OR_ORDERS = re.compile(r"\b(products|orders|order_items)\b")
+
+
+def seed(db_path: str, n_carts: int):
+    engine = create_database(db_path)
+    seed_catalog(engine, 1, price=25, total_units=STOCK, remaining_units=STOCK, quantity=STOCK)
+    cart_ids = seed_buyers(engine, n_carts, items={1: 2})
+    engine.dispose()
+    return cart_ids
+
+
+class StatementLog:
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def touching_stock_or_orders(self, since: int):
+        return [s for s in self.statements[since:] if _TOUCHES_STOCK_OR_ORDERS.search(s)]
+
+
+def headers_for(user_id: int, key=None):
+    headers = {"Authorization": f"Bearer {create_token({'sub': f'buyer{user_id}@example.com', 'user_id': user_id})}"}
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    return headers
+
+
+async def run(args):
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append((name, ok, detail))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        cart_ids = seed(db_path, args.baseline + 1)
+        engine, SessionLocal = open_database(db_path, pool_size=16)
+        app = build_app(SessionLocal, cart.router, orders.router)
+        log = StatementLog(engine)
+        token_cache.clear()
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            target = cart_ids[0]
+            headers = headers_for(1, key="checkout-once")
+            url = f"/cart/checkout/{target}"
+
+            responses = await asyncio.gather(*(client.post(url, headers=headers) for _ in range(args.parallel)))
+            statuses = Counter(r.status_code for r in responses)
+            first = next((r for r in responses if r.status_code == 200), None)
+            check("parallel: only 200s and 409s", set(statuses) <= {200, 409}, dict(statuses))
+            check("parallel: at least one 200", first is not None)
+
+            async with SessionLocal() as db:
+                orders_placed = await db.scalar(select(func.count(models.Order.id)))
+                remaining = await db.scalar(select(models.Product.remaining_units))
+            check("one order placed", orders_placed == 1, f"{orders_placed} orders")
+            check("stock taken once", remaining == STOCK - 2, f"{STOCK - remaining} units taken")
+
+            mark = len(log.statements)
+            replay_times = []
+            mismatched = 0
+            for _ in range(args.retries):
+                start = time.perf_counter()
+                retry = await client.post(url, headers=headers)
+                replay_times.append(time.perf_counter() - start)
+                if (retry.status_code, retry.content) != (200, first.content if first else None):
+                    mismatched += 1
+            check("retries replay the first response", mismatched == 0, f"{mismatched} differed")
+            touched = log.touching_stock_or_orders(mark)
+            check("replays leave products/orders alone", not touched, touched[:1])
+
+            reused = await client.post("/orders/", json={"cart_id": target}, headers=headers)
+            check("key reused for another request is refused", reused.status_code == 422, reused.status_code)
+
+            first_times = []
+            for user_id, cart_id in enumerate(cart_ids[1:], start=2):
+                start = time.perf_counter()
+                response = await client.post(
+                    f"/cart/checkout/{cart_id}", headers=headers_for(user_id, key=f"checkout-{cart_id}")
+                )
+                first_times.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        await engine.dispose()
+
+    return checks, statistics.median(first_times), statistics.median(replay_times)
+
+
+def main():
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=50)
+    parser.add_argument("--retries", type=int, default=200)
+    parser.add_argument("--baseline", type=int, default=200, help="first-time checkouts to time")
+    args = parser.parse_args()
+
+    checks, first_ms, replay_ms = asyncio.run(run(args))
+    failed = False
+    for name, ok, detail in checks:
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAILED':<8}{name:<44}{detail}")
+    print(f"\nmedian first checkout {first_ms * 1000:.2f} ms, median replay {replay_ms * 1000:.2f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
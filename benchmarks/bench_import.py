@@ -0,0 +1,118 @@
+"""Bulk import throughput: POST /products/bulk vs one POST /products/ per row.
+
+Seeds a scratch database with the FTS index and triggers the app uses, then
+imports --rows generated products in each upload format through the real
+router over ASGI (categories given by name, a few invalid rows mixed in) and
+reports rows/sec. The per-row baseline posts --baseline-rows products one at a
+time, the way test_data.py seeds the catalog.
+
+Run from the project root:
+    python -m benchmarks.bench_import --rows 500000
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+
+import httpx
+import orjson
+
+from benchmarks.common import build_app, create_database, open_database, seed_catalog
+from cache import catalog_cache, NullBackend
+import routers.products as products
+import schemas
+
+# Named as seed_catalog names categories 1..20
+CATEGORIES = [f"Category {c}" for c in range(1, 21)]
+
+
+def seed(db_path: str):
+    engine = create_database(db_path, search=True)
+    seed_catalog(engine, 0, categories=len(CATEGORIES))
+    engine.dispose()
+
+
+def generate(n_rows: int):
+    rows = []
+    for i in range(n_rows):
+        row = {
+            "name": f"Product {i}",
+            "description": f"Imported item number {i}",
+            "price": i % 1000 + 0.99,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "total_units": 100,
+            "quantity": 1,
+        }
+        if i % 1000 == 999:
+            row["price"] = "not a price"
+        rows.append(row)
+    return rows
+
+
+def encode(rows, fmt: str):
+    if fmt == "json":
+        return orjson.dumps(rows), "application/json"
+    if fmt == "ndjson":
+        return b"".join(orjson.dumps(row) + b"\n" for row in rows), "application/x-ndjson"
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode(), "text/csv"
+
+
+async def run(db_path: str, rows, baseline_rows: int):
+    engine, session_factory = open_database(db_path)
+    admin = schemas.CurrentUser(id=1, email="admin@example.com", role="admin")
+    app = build_app(session_factory, products.router, user=admin)
+    results = []
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+        ) as client:
+            for fmt in ("ndjson", "json", "csv"):
+                body, content_type = encode(rows, fmt)
+                start = time.perf_counter()
+                response = await client.post(
+                    "/products/bulk", content=body, headers={"content-type": content_type}
+                )
+                elapsed = time.perf_counter() - start
+                response.raise_for_status()
+                report = response.json()
+                results.append((f"bulk {fmt}", report["received"], report["imported"], elapsed))
+
+            start = time.perf_counter()
+            for i, row in enumerate(rows[:baseline_rows]):
+                payload = dict(row, category_id=i % len(CATEGORIES) + 1, remaining_units=row["total_units"])
+                if isinstance(payload["price"], str):
+                    payload["price"] = 1
+                response = await client.post("/products/", json=payload)
+                response.raise_for_status()
+            elapsed = time.perf_counter() - start
+            results.append(("POST per row", baseline_rows, baseline_rows, elapsed))
+    finally:
+        await engine.dispose()
+    return results
+
+
+def main():
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--baseline-rows", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rows = generate(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed(db_path)
+        print(f"{'import':<16}{'rows':>10}{'imported':>10}{'seconds':>9}{'rows/s':>10}")
+        for name, received, imported, elapsed in asyncio.run(run(db_path, rows, args.baseline_rows)):
+            print(f"{name:<16}{received:>10}{imported:>10}{elapsed:>9.1f}{received / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
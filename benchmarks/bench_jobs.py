@@ -0,0 +1,171 @@
+"""Post-checkout jobs: checkout latency with the outbox, delivery, retries and restarts.
+
+Runs the cart router over ASGI against a scratch SQLite database, with
+notifications pointed at a local SMTPStub that answers DATA after
+--smtp-latency seconds:
+
+1. --orders checkouts with no queue running. Times them, and also times
+   sending one confirmation inline, which is what each checkout would
+   otherwise wait for. The jobs stay in the outbox.
+2. A "restart": a fresh engine and JobQueue pick those jobs up. Checks that
+   every order got exactly one confirmation, and times the drain.
+3. --retry-orders more checkouts while the stub refuses the next few
+   messages with 451. Checks that retries with backoff still deliver every
+   email, that the one low-stock alert went out, and that no job is left.
+
+Exits 1 if a check fails.
+
+Run from the project root:
+    python -m benchmarks.bench_jobs --orders 200 --smtp-latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import func, select
+
+from benchmarks.common import build_app, create_database, open_database, seed_buyers, seed_catalog
+from benchmarks.smtp_stub import SMTPStub
+from cache import catalog_cache, NullBackend
+from routers.auth import create_token, token_cache
+import routers.cart as cart
+import jobs
+import notifications
+import models
+
+ALERT_EMAIL = "stock@example.com"
+
+
+def seed(db_path: str, n_carts: int, stock: int):
+    engine = create_database(db_path)
+    seed_catalog(engine, 1, price=25, total_units=stock, remaining_units=stock, quantity=stock)
+    cart_ids = seed_buyers(engine, n_carts, items={1: 2})
+    engine.dispose()
+    return list(zip(range(1, n_carts + 1), cart_ids))
+
+
+async def checkout(client, user_id: int, cart_id: int):
+    token = create_token({"sub": f"buyer{user_id}@example.com", "user_id": user_id})
+    start = time.perf_counter()
+    response = await client.post(f"/cart/checkout/{cart_id}", headers={"Authorization": f"Bearer {token}"})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def outbox(session_factory):
+    async with session_factory() as db:
+        return dict((await db.execute(
+            select(models.Job.status, func.count(models.Job.id)).group_by(models.Job.status)
+        )).all())
+
+
+async def drain(session_factory, timeout: float):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        statuses = await outbox(session_factory)
+        if not statuses.get(jobs.PENDING) and not statuses.get(jobs.RUNNING):
+            return time.perf_counter() - start
+        await asyncio.sleep(0.02)
+    return None
+
+
+async def run(args):
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append((name, ok, detail))
+
+    stub = await SMTPStub(latency=args.smtp_latency).start()
+    notifications.SMTP_HOST, notifications.SMTP_PORT = stub.host, stub.port
+    notifications.STOCK_ALERT_EMAIL = ALERT_EMAIL
+    jobs.JOB_BACKOFF_SECONDS = 0.05
+
+    total = args.orders + args.retry_orders
+    # The last checkout leaves 3 units: exactly one order crosses LOW_STOCK_THRESHOLD
+    stock = 2 * total + 3
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        buyers = seed(db_path, total, stock)
+        token_cache.clear()
+
+        # 1. Checkouts with the queue down: the jobs wait in the outbox
+        engine, session_factory = open_database(db_path, pool_size=8)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app(session_factory, cart.router)),
+                                     base_url="http://bench") as client:
+            latencies = [await checkout(client, u, c) for u, c in buyers[:args.orders]]
+        queued = await outbox(session_factory)
+        check("jobs queued while no worker runs", queued.get(jobs.PENDING) == 2 * args.orders, queued)
+
+        inline = []
+        async with session_factory() as db:
+            for order_id in range(1, 21):
+                start = time.perf_counter()
+                await notifications.send_order_confirmation(db, {"order_id": order_id})
+                inline.append(time.perf_counter() - start)
+        stub.messages.clear()
+        await engine.dispose()
+
+        # 2. "Restart": new engine, new queue, same outbox
+        engine, session_factory = open_database(db_path, pool_size=8)
+        queue = jobs.JobQueue(concurrency=args.concurrency)
+        jobs.queue = queue
+        worker = asyncio.create_task(queue.run(session_factory))
+        drained = await drain(session_factory, timeout=60)
+        subjects = Counter(m["Subject"] for m in stub.messages)
+        check("outbox drained after restart", drained is not None, await outbox(session_factory))
+        check("one confirmation per order", len(subjects) == args.orders and set(subjects.values()) == {1},
+              f"{sum(subjects.values())} emails for {len(subjects)} orders")
+
+        # 3. Refused deliveries are retried
+        stub.messages.clear()
+        stub.fail_next = args.refuse
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=build_app(session_factory, cart.router)),
+                                     base_url="http://bench") as client:
+            await asyncio.gather(*(checkout(client, u, c) for u, c in buyers[args.orders:]))
+        await drain(session_factory, timeout=60)
+        recipients = Counter(m["To"] for m in stub.messages)
+        alerts = recipients.pop(ALERT_EMAIL, 0)
+        check(f"{args.refuse} refused deliveries retried", stub.refused == args.refuse
+              and len(recipients) == args.retry_orders and set(recipients.values()) == {1},
+              f"{stub.refused} refused, {sum(recipients.values())} confirmations")
+        check("one low-stock alert", alerts == 1, f"{alerts} alerts")
+        left = await outbox(session_factory)
+        check("no jobs left or failed", not left, left)
+
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+        await engine.dispose()
+    await stub.stop()
+    return checks, latencies, drained, inline
+
+
+def main():
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--retry-orders", type=int, default=20)
+    parser.add_argument("--refuse", type=int, default=5, help="messages the stub refuses in step 3")
+    parser.add_argument("--smtp-latency", type=float, default=0.05, help="seconds the stub takes per message")
+    parser.add_argument("--concurrency", type=int, default=jobs.JOB_CONCURRENCY, help="jobs run at once")
+    args = parser.parse_args()
+
+    checks, latencies, drained, inline = asyncio.run(run(args))
+    failed = False
+    for name, ok, detail in checks:
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAILED':<8}{name:<40}{detail}")
+    print(f"\nmedian checkout {statistics.median(latencies) * 1000:.2f} ms (jobs queued); "
+          f"sending the confirmation inline would add {statistics.median(inline) * 1000:.2f} ms")
+    if drained is not None:
+        print(f"{args.orders} orders' jobs delivered in {drained:.2f} s with {args.concurrency} concurrent jobs")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Write amplification of placing orders: order_items vs cloned snapshot carts.
+
+Checks out --orders carts of --items lines each, once through
+checkout.place_order (one order row plus one order_items row per line) and once
+through the previous implementation that cloned the cart and its cart_items
+for every order. Reports write statements, rows inserted, how many rows
+carts/cart_items end up with, and how much the database file grew.
+
+Run from the project root:
+    python -m benchmarks.bench_order_writes --orders 2000 --items 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import event, insert, select, text, func, update
+
+from benchmarks.common import create_database, open_database, seed_buyers, seed_catalog
+from cache import catalog_cache, NullBackend
+from checkout import place_order
+from database import create_db_engine
+from routers.cart import CART_ITEMS_WITH_PRODUCTS
+import models
+
+
+async def legacy_place_order(db, cart):
+    # place_order before order_items: the order pointed at a cloned, checked-out
+    # copy of the cart with a copy of every cart item.
+    await db.execute(
+        update(models.Cart).where(models.Cart.id == cart.id).values(is_checked_out=True)
+    )
+    total = 0
+    for item in sorted(cart.items, key=lambda ci: ci.product_id):
+        await db.execute(
+            update(models.Product)
+            .where(models.Product.id == item.product_id, models.Product.remaining_units >= item.quantity)
+            .values(remaining_units=models.Product.remaining_units - item.quantity)
+            .returning(models.Product.remaining_units)
+        )
+        total += item.product.price * item.quantity
+    order_cart = models.Cart(user_id=cart.user_id, is_checked_out=True)
+    db.add(order_cart)
+    await db.flush()
+    await db.execute(insert(models.CartItem), [
+        {"cart_id": order_cart.id, "product_id": item.product_id, "quantity": item.quantity}
+        for item in cart.items
+    ])
+    order = models.Order(user_id=cart.user_id, cart_id=order_cart.id, total_amount=total)
+    db.add(order)
+    await db.commit()
+    return order
+
+
+class WriteCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")):
+            self.statements += 1
+
+
+ORDER_TABLES = (models.Cart, models.CartItem, models.Order, models.OrderItem)
+
+
+def row_counts(engine):
+    with engine.connect() as conn:
+        return {
+            model: conn.scalar(select(func.count()).select_from(model)) for model in ORDER_TABLES
+        }
+
+
+def seed(db_path: str, n_orders: int, n_items: int):
+    engine = create_database(db_path)
+    seed_catalog(engine, n_items, price=lambda p: 10 + p, total_units=10**9, remaining_units=10**9, quantity=1)
+    # One buyer per cart: a user has at most one active cart
+    carts = seed_buyers(engine, n_orders, items={p: 1 for p in range(1, n_items + 1)})
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    engine.dispose()
+    return carts
+
+
+def db_size(engine):
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        return conn.scalar(text("PRAGMA page_count")) * conn.scalar(text("PRAGMA page_size"))
+
+
+async def checkout_all(db_path: str, cart_ids, checkout_fn):
+    engine, SessionLocal = open_database(db_path)
+    counter = WriteCounter(engine.sync_engine)
+    start = time.perf_counter()
+    try:
+        for cart_id in cart_ids:
+            async with SessionLocal() as db:
+                cart = await db.scalar(
+                    select(models.Cart).options(CART_ITEMS_WITH_PRODUCTS).where(models.Cart.id == cart_id)
+                )
+                await checkout_fn(db, cart)
+        return counter, time.perf_counter() - start
+    finally:
+        await engine.dispose()
+
+
+def run(checkout_fn, n_orders: int, n_items: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        cart_ids = seed(db_path, n_orders, n_items)
+        engine = create_db_engine(f"sqlite:///{db_path}")
+        size_before = db_size(engine)
+        rows_before = row_counts(engine)
+        counter, elapsed = asyncio.run(checkout_all(db_path, cart_ids, checkout_fn))
+        rows_after = row_counts(engine)
+        grown = db_size(engine) - size_before
+        engine.dispose()
+    return {
+        "statements": counter.statements / n_orders,
+        "rows": sum(rows_after[m] - rows_before[m] for m in ORDER_TABLES) / n_orders,
+        "carts": rows_after[models.Cart],
+        "cart_items": rows_after[models.CartItem],
+        "kib": grown / 1024,
+        "orders_per_sec": n_orders / elapsed,
+    }
+
+
+def main():
+    catalog_cache.backend = NullBackend()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.orders} orders x {args.items} lines\n")
+    print(f"{'implementation':<16}{'writes/order':>14}{'inserts/order':>15}{'carts':>8}"
+          f"{'cart_items':>12}{'db +KiB':>10}{'orders/s':>10}")
+    for name, fn in (("cloned carts", legacy_place_order), ("order_items", place_order)):
+        r = run(fn, args.orders, args.items)
+        print(f"{name:<16}{r['statements']:>14.1f}{r['rows']:>15.1f}{r['carts']:>8}"
+              f"{r['cart_items']:>12}{r['kib']:>10.0f}{r['orders_per_sec']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
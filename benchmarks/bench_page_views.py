@@ -0,0 +1,131 @@
+"""Page views of /products and /categories: empty shell + API fetch vs server-rendered.
+
+Generates a SQLite database with --products products in --categories
+categories, starts main.app on it over ASGI and replays what a browser does
+for one view of each page: fetch the HTML, then its stylesheet and script in
+parallel, then (for the shell) the API calls the page script makes to fill it
+in: GET /products/, or GET /categories/ followed by GET /products/?category_id=.
+A server-rendered page carries that data inline, so the view ends with the
+assets.
+
+Views run --views times with SSR_PAGES off and on and report requests, bytes
+sent (Content-Length, gzip accepted) and median time to content, for a cold
+view (empty browser cache) and a warm one (hashed assets cached, the page and
+API responses revalidated with their ETags).
+
+Run from the project root:
+    python -m benchmarks.bench_page_views --products 5000 --views 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+import httpx
+
+ACCEPT = {"accept-encoding": "gzip"}
+
+
+def seed(engine, args):
+    from benchmarks.common import seed_catalog
+
+    seed_catalog(engine, args.products, args.categories)
+
+
+class View:
+    """One page view's requests against a browser cache of url -> (ETag, body)."""
+
+    def __init__(self, client, cache: dict):
+        self.client = client
+        self.cache = cache
+        self.requests = 0
+        self.bytes = 0
+
+    async def get(self, url: str):
+        """The response and its body, from the cache on a 304."""
+        headers = dict(ACCEPT)
+        if url in self.cache:
+            headers["if-none-match"] = self.cache[url][0]
+        response = await self.client.get(url, headers=headers)
+        if response.status_code >= 400:
+            response.raise_for_status()
+        self.requests += 1
+        self.bytes += int(response.headers.get("content-length", 0))
+        if response.status_code == 304:
+            return response, self.cache[url][1]
+        if "etag" in response.headers:
+            self.cache[url] = (response.headers["etag"], response.content)
+        return response, response.content
+
+
+async def page_view(client, path: str, cache: dict, cached_assets: set):
+    view = View(client, cache)
+    start = time.perf_counter()
+    _, html = await view.get(path)
+    html = html.decode()
+
+    assets = [url for url in re.findall(r'(?:href|src)="(/static/[^"]+)"', html) if url not in cached_assets]
+    for url, (response, _) in zip(assets, await asyncio.gather(*(view.get(url) for url in assets))):
+        if "immutable" in response.headers.get("cache-control", ""):
+            cached_assets.add(url)
+
+    if 'id="initialData"' not in html:
+        # What the page script fetches to fill the shell
+        if path == "/products":
+            await view.get("/products/")
+        else:
+            _, categories = await view.get("/categories/")
+            categories = json.loads(categories)
+            if categories:
+                await view.get(f"/products/?category_id={categories[0]['id']}")
+    return view.requests, view.bytes, time.perf_counter() - start
+
+
+async def measure(app, path: str, views: int):
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for kind in ("cold", "warm"):
+            cache, cached_assets = {}, set()
+            if kind == "warm":
+                await page_view(client, path, cache, cached_assets)
+            runs = []
+            for _ in range(views):
+                runs.append(await page_view(client, path, dict(cache), set(cached_assets)))
+            requests, size, _ = runs[-1]
+            results[kind] = (requests, size, statistics.median(r[2] for r in runs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--views", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Read by database.py at import time; importing main creates the schema
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'views.db')}"
+        os.environ.setdefault("SLOW_QUERY_MS", "0")
+        import main as app_main
+        from database import engine
+        seed(engine, args)
+
+        print(f"{args.products} products in {args.categories} categories, median of {args.views} views\n")
+        print(f"{'':<24}{'requests':>10}{'bytes':>10}{'time to content':>18}")
+        for path in ("/products", "/categories"):
+            for ssr in (False, True):
+                app_main.SSR_PAGES = ssr
+                results = asyncio.run(measure(app_main.app, path, args.views))
+                for kind, (requests, size, seconds) in results.items():
+                    label = f"{path} {'ssr' if ssr else 'shell'} {kind}"
+                    print(f"{label:<24}{requests:>10}{size:>10}{seconds * 1000:>15.2f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
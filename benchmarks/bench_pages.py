@@ -0,0 +1,133 @@
+"""Page and static asset serving: per-request template rendering vs pre-rendered pages.
+
+Builds two apps over the real templates/ and static/ directories: the previous
+setup (sync routes rendering Jinja2Templates.TemplateResponse on every hit,
+plain StaticFiles) and the current one (pages.Pages and pages.StaticAssets:
+pages pre-rendered at startup, hashed assets served precompressed from
+memory). Fires --requests GETs per page route and per asset at each over ASGI
+and reports requests/sec and the bytes a browser accepting gzip downloads for
+one cold page view (HTML + CSS + JS). It also reports the bytes for a warm
+view, where hashed assets come from the browser cache and the page
+revalidates with a 304.
+
+Run from the project root:
+    python -m benchmarks.bench_pages --requests 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import re
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+
+from pages import Pages, StaticAssets
+
+PAGES = {
+    "/": "index.html",
+    "/products": "products.html",
+    "/categories": "categories.html",
+    "/search": "search.html",
+    "/cart": "cart.html",
+    "/login": "login.html",
+    "/register": "register.html",
+}
+
+
+def legacy_app():
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals["static_url"] = lambda name: f"/static/{name}"
+
+    for path, name in PAGES.items():
+        def page(request: Request, name=name):
+            return templates.TemplateResponse(name, {"request": request})
+        app.add_api_route(path, page, methods=["GET"])
+    return app
+
+
+def current_app():
+    app = FastAPI()
+    assets = StaticAssets(directory="static")
+    app.mount("/static", assets, name="static")
+    templates = Jinja2Templates(directory="templates")
+    templates.env.globals["static_url"] = assets.url
+    pages = Pages(templates.env)
+
+    for path, name in PAGES.items():
+        async def page(request: Request, name=name):
+            return pages.response(request, name)
+        app.add_api_route(path, page, methods=["GET"])
+    return app
+
+
+async def throughput(client, url: str, requests: int, concurrency: int):
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            response = await client.get(url, headers={"accept-encoding": "gzip"})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def page_view_bytes(client, path: str):
+    # httpx decodes bodies, so count the bytes as sent: the Content-Length header
+    headers = {"accept-encoding": "gzip"}
+    page = await client.get(path, headers=headers)
+    cold = int(page.headers["content-length"])
+    warm_headers = dict(headers)
+    if "etag" in page.headers:
+        warm_headers["if-none-match"] = page.headers["etag"]
+    warm = int((await client.get(path, headers=warm_headers)).headers.get("content-length", 0))
+    for asset in re.findall(r'(?:href|src)="(/static/[^"]+)"', page.text):
+        response = await client.get(asset, headers=headers)
+        cold += int(response.headers["content-length"])
+        if "immutable" not in response.headers.get("cache-control", ""):
+            # Not cacheable for good: a warm view revalidates (or refetches) it
+            revalidate = dict(headers)
+            if "etag" in response.headers:
+                revalidate["if-none-match"] = response.headers["etag"]
+            warm += int((await client.get(asset, headers=revalidate)).headers.get("content-length", 0))
+    return cold, warm
+
+
+async def run(app, args):
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        home = await client.get("/")
+        assets = re.findall(r'(?:href|src)="(/static/[^"]+)"', home.text)
+        for url in list(PAGES) + assets:
+            label = url if url in PAGES else "/static/" + url.rsplit("/", 1)[1].split(".")[0] + "." + url.rsplit(".", 1)[1]
+            results[label] = await throughput(client, url, args.requests, args.concurrency)
+        results["cold view bytes"], results["warm view bytes"] = await page_view_bytes(client, "/")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    legacy = asyncio.run(run(legacy_app(), args))
+    current = asyncio.run(run(current_app(), args))
+
+    print(f"{args.requests} requests per URL, {args.concurrency} concurrent, Accept-Encoding: gzip\n")
+    print(f"{'':<22}{'rendered per hit':>18}{'pre-rendered':>14}{'speedup':>9}")
+    for label in legacy:
+        if label.endswith("bytes"):
+            continue
+        print(f"{label + ' req/s':<22}{legacy[label]:>18.0f}{current[label]:>14.0f}{current[label] / legacy[label]:>8.1f}x")
+    for label in ("cold view bytes", "warm view bytes"):
+        print(f"{label:<22}{legacy[label]:>18}{current[label]:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Search latency benchmark.
+
+Builds a throwaway SQLite catalog and compares the FTS5 search used by
+GET /products/search with the old approach of loading every product and
+filtering in Python (what search.html did in the browser).
+
+Run from the project root:
+    python -m benchmarks.bench_search --products 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import select
+
+from benchmarks.common import create_database, open_database, seed_catalog
+from search import search_product_ids
+import models
+
+WORDS = [
+    "laptop", "phone", "wireless", "headphones", "watch", "smart", "cotton", "denim",
+    "running", "shoes", "leather", "classic", "premium", "portable", "gaming", "office",
+    "kitchen", "steel", "organic", "vintage", "lightweight", "waterproof", "digital", "camera",
+]
+QUERIES = ["laptop", "wireless head", "smart watch", "premium leather shoes", "vint", "zzz"]
+
+
+def build_catalog(db_path: str, n_products: int):
+    engine = create_database(db_path, search=True)
+    rng = random.Random(42)
+    seed_catalog(
+        engine, n_products,
+        name=lambda p: " ".join(rng.sample(WORDS, 3)) + f" {p}",
+        description=lambda p: " ".join(rng.choices(WORDS, k=12)),
+        price=lambda p: rng.randint(100, 100000),
+        total_units=10, remaining_units=10, quantity=10,
+    )
+    engine.dispose()
+
+
+async def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+async def run(db_path: str, repeat: int):
+    engine, session_factory = open_database(db_path)
+    print(f"{'query':<24}{'hits':>8}{'fts p50 ms':>12}{'fts p95 ms':>12}{'scan p50 ms':>13}")
+    async with session_factory() as db:
+        for q in QUERIES:
+            total, _ = await search_product_ids(db, q, limit=20, offset=0)
+            fts = await timed(lambda: search_product_ids(db, q, limit=20, offset=0), repeat)
+
+            terms = q.split()
+
+            async def full_scan():
+                db.expunge_all()
+                return [
+                    p for p in await db.scalars(select(models.Product))
+                    if all(t in p.name or t in (p.description or "") for t in terms)
+                ][:20]
+
+            scan = await timed(full_scan, max(1, repeat // 10))
+            print(f"{q:<24}{total:>8}{fts[0]:>12.2f}{fts[1]:>12.2f}{scan[0]:>13.1f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        build_catalog(db_path, args.products)
+        print(f"seeded {args.products} products in {time.perf_counter() - start:.1f}s\n")
+        asyncio.run(run(db_path, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Per-item JSON serialization cost of large product responses.
+
+Loads N products (10k by default) with their categories once, then serves them
+from in-process FastAPI routes that differ only in how the body is produced:
+
+    legacy         hand-built dicts, re-validated against response_model and
+                   encoded with the stdlib encoder (how the routers used to work)
+    fast           validated once from the ORM rows through a TypeAdapter and
+                   sent as orjson bytes (serialization.json_response)
+    legacy cached  the cached dicts of a catalog cache hit, legacy path
+    fast cached    the cached dicts of a catalog cache hit, sent as orjson bytes
+
+Run from the project root:
+    python -m benchmarks.bench_serialization --products 10000 --rounds 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload
+
+from benchmarks.common import create_database, seed_catalog
+import routers.products as products
+import models
+import schemas
+
+
+def seed(db_path: str, n_products: int):
+    engine = create_database(db_path)
+    # A third of the products out of stock, so both stock_status values are serialized
+    seed_catalog(engine, n_products, categories=10, price=lambda p: p + 0.5, remaining_units=lambda p: p % 3)
+    return engine
+
+
+def legacy_serialize_product(p: models.Product):
+    return {
+        "id": p.id,
+        "name": p.name,
+        "description": p.description,
+        "price": p.price,
+        "category": {
+            "id": p.category.id,
+            "name": p.category.name,
+            "description": p.category.description
+        },
+        "quantity": p.quantity,
+        "stock_status": "Out of Stock" if p.remaining_units == 0 else "Available"
+    }
+
+
+def build_app(rows):
+    cached = {"items": products.serialize_products(rows), "next_cursor": None}
+    app = FastAPI()
+
+    @app.get("/legacy", response_model=schemas.ProductPage, response_class=JSONResponse)
+    def legacy():
+        return {"items": [legacy_serialize_product(p) for p in rows], "next_cursor": None}
+
+    @app.get("/fast", response_model=schemas.ProductPage)
+    def fast():
+        return ORJSONResponse({"items": products.serialize_products(rows), "next_cursor": None})
+
+    @app.get("/legacy-cached", response_model=schemas.ProductPage, response_class=JSONResponse)
+    def legacy_cached():
+        return cached
+
+    @app.get("/fast-cached", response_model=schemas.ProductPage)
+    def fast_cached():
+        return ORJSONResponse(cached)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = seed(os.path.join(tmp, "bench.db"), args.products)
+        with Session(engine) as db:
+            rows = db.scalars(
+                select(models.Product).options(joinedload(models.Product.category)).order_by(models.Product.id)
+            ).all()
+
+            with TestClient(build_app(rows)) as client:
+                bodies = {}
+                print(f"{args.products} products per response, best of {args.rounds} rounds\n")
+                print(f"{'path':<16}{'ms/response':>14}{'us/item':>10}{'KiB':>10}")
+                for name, path in (
+                    ("legacy", "/legacy"),
+                    ("fast", "/fast"),
+                    ("legacy cached", "/legacy-cached"),
+                    ("fast cached", "/fast-cached"),
+                ):
+                    best = float("inf")
+                    for _ in range(args.rounds):
+                        start = time.perf_counter()
+                        response = client.get(path)
+                        best = min(best, time.perf_counter() - start)
+                        response.raise_for_status()
+                    bodies[name] = response.json()
+                    print(f"{name:<16}{best * 1000:>14.1f}{best * 1e6 / args.products:>10.2f}"
+                          f"{len(response.content) / 1024:>10.0f}")
+        engine.dispose()
+
+    if any(body != bodies["legacy"] for body in bodies.values()):
+        raise SystemExit("response bodies differ between paths")
+
+
+if __name__ == "__main__":
+    main()
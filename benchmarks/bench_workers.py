@@ -0,0 +1,199 @@
+"""Throughput of serve.py with 1 to N worker processes, and shared state between them.
+
+Generates a SQLite database with --products products, then for each worker
+count starts ``python serve.py --workers n`` on a free port and drives it
+over real HTTP from --clients client processes for --seconds: catalog
+listings at random cursors and categories, and searches. Reports requests
+per second and median/p99 latency per worker count.
+
+With more than one worker it also checks the state the workers share:
+
+- a category created through one connection is listed by every later
+  GET /categories/, whichever worker answers (shared catalog cache versions);
+- /metrics counts every listing request the clients made, not just those of
+  the worker that answers it (per-worker snapshots, merged).
+
+Scaling is bounded by the cores available: on a single-core machine the
+workers take turns and throughput stays flat. Exits 1 if a check fails.
+
+Run from the project root:
+    python -m benchmarks.bench_workers --max-workers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SEARCH_TERMS = ["Product", "Generated", "Product 1", "Product 42", "Generated product 7"]
+
+
+def seed(db_path: str, args):
+    # Imported here: the client processes re-import this module and don't need the app
+    from benchmarks.common import create_database, seed_catalog
+
+    engine = create_database(db_path)
+    seed_catalog(engine, args.products, args.categories)
+    engine.dispose()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, port: int, db_path: str):
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        METRICS_SNAPSHOT_INTERVAL="0.5",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/products/", timeout=1).status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("serve.py did not start within 60 s")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def client(base_url: str, seconds: float, products: int, categories: int, seed_value: int):
+    """Requests from one client process for ``seconds``: (latencies, listings, errors)."""
+    rng = random.Random(seed_value)
+    latencies, listings, errors = [], 0, 0
+    # A few connections per client, so requests spread over the workers
+    with httpx.Client(base_url=base_url, timeout=30, limits=httpx.Limits(max_keepalive_connections=4)) as http:
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < 0.7:
+                params = {"cursor": rng.randint(0, products)}
+                if roll < 0.3:
+                    params["category_id"] = rng.randint(1, categories)
+                path = "/products/"
+                listings += 1
+            else:
+                params = {"q": rng.choice(SEARCH_TERMS)}
+                path = "/products/search"
+            start = time.perf_counter()
+            try:
+                response = http.get(path, params=params)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    return latencies, listings, errors
+
+
+def drive(port: int, args):
+    base_url = f"http://127.0.0.1:{port}"
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.clients) as pool:
+        results = pool.starmap(client, [
+            (base_url, args.seconds, args.products, args.categories, i) for i in range(args.clients)
+        ])
+    latencies = sorted(l for result in results for l in result[0])
+    listings = sum(result[1] for result in results)
+    errors = sum(result[2] for result in results)
+    return latencies, listings, errors
+
+
+def check_shared_state(port: int, workers: int, listings: int, check):
+    base_url = f"http://127.0.0.1:{port}"
+    name = f"Created with {workers} workers"
+    # Warm every worker's category cache first, so a stale one would show
+    for _ in range(workers * 4):
+        httpx.get(f"{base_url}/categories/").raise_for_status()
+    httpx.post(f"{base_url}/categories/", json={"name": name, "description": ""}).raise_for_status()
+    # A new connection each time: the kernel hands them out across the workers
+    stale = sum(
+        name not in {c["name"] for c in httpx.get(f"{base_url}/categories/").json()}
+        for _ in range(workers * 10)
+    )
+    check(f"new category seen by all {workers} workers", stale == 0, f"{stale} stale responses")
+
+    time.sleep(1.5)
+    text = httpx.get(f"{base_url}/metrics").text
+    counted = sum(
+        int(count) for count in
+        re.findall(r'^http_requests_total\{method="GET",route="/products/",status="200"\} (\d+)$', text, re.M)
+    )
+    check(f"/metrics counts all {workers} workers", counted >= listings,
+          f"{counted} listings counted, {listings} sent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--clients", type=int, default=8, help="client processes generating load")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=50)
+    args = parser.parse_args()
+
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append((name, ok, detail))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed(db_path, args)
+        for workers in range(1, args.max_workers + 1):
+            port = free_port()
+            server = start_server(workers, port, db_path)
+            try:
+                latencies, listings, errors = drive(port, args)
+                if workers > 1:
+                    check_shared_state(port, workers, listings, check)
+            finally:
+                stop_server(server)
+            rows.append((
+                workers, len(latencies) / args.seconds, statistics.median(latencies) * 1000,
+                latencies[int(len(latencies) * 0.99)] * 1000, errors,
+            ))
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes, {args.seconds:g} s per run\n")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for workers, rate, p50, p99, errors in rows:
+        print(f"{workers:>8}{rate:>10.0f}{p50:>10.2f}{p99:>10.2f}{errors:>8}")
+    failed = any(row[4] for row in rows)
+    if checks:
+        print()
+    for name, ok, detail in checks:
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAILED':<8}{name:<40}{detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
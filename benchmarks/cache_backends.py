@@ -0,0 +1,167 @@
+"""Check that the catalog cache answers the same through RedisBackend as in memory.
+
+Runs the catalog routers over ASGI twice on identically seeded databases,
+once with MemoryBackend and once with RedisBackend on FakeRedis (the part of
+the redis.asyncio client it uses, kept in a dict, values as bytes), and
+replays the same reads and writes: listings, categories, a category
+created, a product updated. Every response and the cache's hit/miss counts
+must match, so values survive the JSON round trip and invalidations reach
+the shared counters. Also checks RedisBackend's own get/set/delete/counter
+paths. Exits 1 if a check fails.
+
+Run from the project root:
+    python -m benchmarks.cache_backends
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import build_app, create_database, open_database, seed_catalog
+from cache import catalog_cache, MemoryBackend, RedisBackend
+from routers.category import category_product_counts
+import routers.category as category
+import routers.products as products
+import schemas
+
+TTL = 60
+
+
+class FakeRedis:
+    """get/set/delete/incr of redis.asyncio, in memory. Like Redis, it stores bytes."""
+
+    def __init__(self):
+        self.data = {}  # key -> (bytes, expires_at or None)
+
+    def _entry(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    async def get(self, key):
+        entry = self._entry(key)
+        return None if entry is None else entry[0]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if ex is not None and ex <= 0:
+            raise ValueError("invalid expire time in 'set' command")
+        if nx and self._entry(key) is not None:
+            return None
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+        self.data[key] = (value, None if ex is None else time.monotonic() + ex)
+        return True
+
+    async def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    async def incr(self, key):
+        entry = self._entry(key)
+        value = (0 if entry is None else int(entry[0])) + 1
+        self.data[key] = (str(value).encode(), None if entry is None else entry[1])
+        return value
+
+
+async def check_backend(check):
+    backend = RedisBackend(FakeRedis(), TTL)
+    value = {"items": [{"id": 1, "price": 9.5, "description": None, "tags": ["a"]}], "next_cursor": None}
+    check("missing key reads as None", await backend.get("k") is None)
+    await backend.set("k", value)
+    check("value survives the round trip", await backend.get("k") == value)
+    await backend.delete("k")
+    check("deleted key reads as None", await backend.get("k") is None)
+
+    start = await backend.get_counter("gen")
+    check("counter starts from the clock", abs(start - time.time() * 1000) < 60_000, start)
+    check("counter read is stable", await backend.get_counter("gen") == start)
+    await backend.incr("gen")
+    await backend.incr("gen")
+    check("incr adds one each time", await backend.get_counter("gen") == start + 2)
+    other = RedisBackend(backend.client, TTL)
+    check("another process sees the same counter", await other.get_counter("gen") == start + 2)
+
+
+async def replay(db_path: str, backend):
+    """Reads and writes through the catalog routers; returns [(step, status, body)]."""
+    engine, session_factory = open_database(db_path)
+    catalog_cache.backend = backend
+    catalog_cache.hits = catalog_cache.misses = 0
+    admin = schemas.CurrentUser(id=1, email="admin@example.com", role="admin")
+    app = build_app(session_factory, products.router, category.router, user=admin)
+    results = []
+    reads = [
+        ("/products/", {}),
+        ("/products/", {"limit": 5, "cursor": 5}),
+        ("/products/", {"category_id": 2}),
+        ("/products/", {"in_stock": "false"}),
+        ("/categories/", {}),
+        ("/categories/1", {}),
+        ("/categories/999", {}),
+    ]
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://check") as client:
+            async def read_all(stage: str):
+                # Twice, so the second read of each is served from the cache
+                for _ in range(2):
+                    for path, params in reads:
+                        response = await client.get(path, params=params)
+                        results.append((f"{stage} GET {path} {params}", response.status_code, response.json()))
+                async with session_factory() as db:
+                    results.append((f"{stage} category_product_counts", 200, await category_product_counts(db)))
+
+            await read_all("seeded:")
+            response = await client.post("/categories/", json={"name": "Created", "description": "new"})
+            results.append(("POST /categories/", response.status_code, response.json()))
+            await read_all("category created:")
+            response = await client.put("/products/1", json={"price": 1234.5, "remaining_units": 0})
+            results.append(("PUT /products/1", response.status_code, response.json()))
+            await read_all("product updated:")
+    finally:
+        await engine.dispose()
+    return results, catalog_cache.stats()
+
+
+def main():
+    checks = []
+
+    def check(name, ok, detail=""):
+        checks.append((name, ok, detail))
+
+    asyncio.run(check_backend(check))
+
+    runs = {}
+    for name, backend in (
+        ("memory", MemoryBackend(maxsize=1024, ttl=TTL)),
+        ("redis", RedisBackend(FakeRedis(), TTL)),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "check.db")
+            engine = create_database(db_path)
+            seed_catalog(engine, 30, categories=3, remaining_units=lambda p: p % 4)
+            engine.dispose()
+            runs[name] = asyncio.run(replay(db_path, backend))
+
+    (memory, memory_stats), (redis, redis_stats) = runs["memory"], runs["redis"]
+    differ = [step for (step, *a), (_, *b) in zip(memory, redis) if a != b]
+    check("same responses through redis", not differ and len(memory) == len(redis),
+          f"first difference: {differ[0]}" if differ else f"{len(redis)} responses")
+    check("same hits and misses", (memory_stats["hits"], memory_stats["misses"])
+          == (redis_stats["hits"], redis_stats["misses"]) and redis_stats["hits"] > 0,
+          f"redis {redis_stats['hits']} hits / {redis_stats['misses']} misses")
+    listed = next(body for step, _, body in redis if step.startswith("category created: GET /categories/ "))
+    check("writes invalidate cached reads", any(c["name"] == "Created" for c in listed))
+
+    failed = False
+    for name, ok, detail in checks:
+        failed = failed or not ok
+        print(f"{'ok' if ok else 'FAILED':<8}{name:<40}{detail}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
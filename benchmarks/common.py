@@ -0,0 +1,97 @@
+"""Scratch databases, seed data and apps over them, for the benchmarks.
+
+Importing this imports database.py, which reads DATABASE_URL: scripts that
+point the whole app at their own database set it first, then import this.
+"""
+from fastapi import FastAPI
+from sqlalchemy import insert
+
+from database import Base, get_async_db, create_db_engine, create_async_db_engine, async_session_factory
+from routers.auth import get_current_user
+from search import init_search_index
+import models
+
+# Rows per INSERT, so large catalogs aren't built in memory at once
+_BATCH = 10_000
+
+
+def create_database(db_path: str, search: bool = False):
+    """A sync engine on a new SQLite database at ``db_path``, with the schema (and search index) created."""
+    engine = create_db_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    if search:
+        init_search_index(engine)
+    return engine
+
+
+def open_database(db_path: str, **engine_kwargs):
+    """The async engine and session factory the routers use, on ``db_path``."""
+    engine = create_async_db_engine(f"sqlite:///{db_path}", **engine_kwargs)
+    return engine, async_session_factory(engine)
+
+
+def seed_catalog(engine, products: int, categories: int = 1, **columns):
+    """Categories 1..``categories`` and products 1..``products`` spread across them.
+
+    ``columns`` override product columns, with a value or a function of the
+    product id.
+    """
+    defaults = {
+        "name": lambda p: f"Product {p}",
+        "description": lambda p: f"Generated product {p}",
+        "price": lambda p: 10 + p % 490,
+        "category_id": lambda p: 1 + p % categories,
+        "total_units": 100,
+        "remaining_units": 100,
+        "quantity": 100,
+    }
+    defaults.update(columns)
+
+    def product(p):
+        return {"id": p, **{name: value(p) if callable(value) else value for name, value in defaults.items()}}
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Category), [
+            {"id": c, "name": f"Category {c}", "description": f"Generated category {c}"}
+            for c in range(1, categories + 1)
+        ])
+        for start in range(1, products + 1, _BATCH):
+            conn.execute(insert(models.Product), [product(p) for p in range(start, min(start + _BATCH, products + 1))])
+
+
+def seed_buyers(engine, buyers: int, items: dict = None, email: str = "buyer{}@example.com"):
+    """Users 1..``buyers``, each with one open cart holding ``items`` (product id -> quantity).
+
+    Returns the cart ids, in user order.
+    """
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": u, "email": email.format(u), "password_hash": "x"} for u in range(1, buyers + 1)
+        ])
+        cart_ids = conn.scalars(
+            insert(models.Cart).returning(models.Cart.id), [{"user_id": u} for u in range(1, buyers + 1)]
+        ).all()
+        if items:
+            conn.execute(insert(models.CartItem), [
+                {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+                for cart_id in cart_ids for product_id, quantity in items.items()
+            ])
+    return list(cart_ids)
+
+
+def build_app(session_factory, *routers, user=None):
+    """An app with ``routers`` on ``session_factory``'s database.
+
+    With ``user`` (a schemas.CurrentUser), every request is authenticated as them.
+    """
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    for router in routers:
+        app.include_router(router)
+    app.dependency_overrides[get_async_db] = override_get_db
+    if user is not None:
+        app.dependency_overrides[get_current_user] = lambda: user
+    return app
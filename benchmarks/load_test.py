@@ -0,0 +1,370 @@
+"""Load test: every user-facing flow against an in-process app and a generated dataset.
+
+Generates a SQLite database with --products products in --categories
+categories and --users customers with --orders-per-user past orders, starts
+main.app on it (in-process over ASGI by default, or behind a local uvicorn with
+--uvicorn) and runs each flow --iterations times with --concurrency virtual
+users:
+
+    register_login  POST /auth/register, POST /auth/login
+    browse          GET /categories/, GET /products/ (random category and page), GET /products/search
+    add_to_cart     POST /cart/
+    checkout        POST /cart/, POST /cart/checkout/{id} with an Idempotency-Key
+    order_history   GET /orders/history/{user_id}, then its second page
+
+Prints throughput and p50/p95/p99 latency per request and saves them as JSON
+(benchmarks/results/ by default, named after the commit) so runs can be
+compared with --compare. Random choices are seeded, so runs are repeatable.
+
+Run from the project root:
+    python -m benchmarks.load_test --products 20000 --users 500 --concurrency 32
+    python -m benchmarks.load_test --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+FLOWS = ("register_login", "browse", "add_to_cart", "checkout", "order_history")
+WORDS = ("red", "blue", "steel", "cotton", "wireless", "compact", "classic", "pro", "mini", "smart")
+PASSWORD = "load-test-password"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def configure_environment(db_path: str, args):
+    # Read by database.py, routers/auth.py and passwords.py at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("LOGIN_IP_ATTEMPTS", "1000000")
+    os.environ.setdefault("LOGIN_EMAIL_ATTEMPTS", "1000000")
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+    os.environ.setdefault("SLOW_QUERY_MS", "0")
+
+
+def seed(engine, args, rng):
+    from sqlalchemy import insert
+    from benchmarks.common import seed_catalog
+    from database import utcnow
+    from passwords import hash_password_sync
+    import models
+
+    password_hash = hash_password_sync(PASSWORD)
+    now = utcnow()
+    seed_catalog(
+        engine, args.products, args.categories,
+        name=lambda p: f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} item {p}",
+        description=lambda p: " ".join(rng.choices(WORDS, k=6)),
+        price=lambda p: round(rng.uniform(1, 500), 2),
+        category_id=lambda p: rng.randint(1, args.categories),
+        total_units=10**9, remaining_units=10**9, quantity=1,
+    )
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": u, "email": f"customer{u}@example.com", "password_hash": password_hash, "role": "user"}
+            for u in range(1, args.users + 1)
+        ])
+        # Past orders, so order history has pages to walk
+        n_orders = args.users * args.orders_per_user
+        conn.execute(insert(models.Cart), [
+            {"id": o, "user_id": (o - 1) % args.users + 1, "is_checked_out": True}
+            for o in range(1, n_orders + 1)
+        ])
+        conn.execute(insert(models.Order), [
+            {
+                "id": o, "user_id": (o - 1) % args.users + 1, "cart_id": o, "total_amount": 0,
+                "order_status": "confirmed", "order_time": now - timedelta(minutes=n_orders - o),
+            }
+            for o in range(1, n_orders + 1)
+        ])
+        conn.execute(insert(models.OrderItem), [
+            {"order_id": o, "product_id": rng.randint(1, args.products), "quantity": 1, "unit_price": 10.0}
+            for o in range(1, n_orders + 1) for _ in range(2)
+        ])
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client, step: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.latencies[step].append(time.perf_counter() - start)
+        # Status 0: the request never got a response
+        status = response.status_code if response is not None else 0
+        self.statuses[step][str(status)] += 1
+        if response is None or response.status_code >= 400:
+            return None
+        return response.json()
+
+
+class Flows:
+    """One iteration of each flow for virtual user number ``worker``."""
+
+    def __init__(self, args, run_id: str):
+        from routers.auth import create_token
+        self.args = args
+        self.run_id = run_id
+        self.tokens = {
+            u: create_token({"sub": f"customer{u}@example.com", "role": "user", "user_id": u})
+            for u in range(1, args.users + 1)
+        }
+
+    def user_for(self, worker: int, iteration: int):
+        # Each worker has its own customers, so no two workers share an active cart
+        per_worker = self.args.users // self.args.concurrency
+        return worker + self.args.concurrency * (iteration % per_worker) + 1
+
+    def auth(self, user_id: int, **headers):
+        return dict(headers, Authorization=f"Bearer {self.tokens[user_id]}")
+
+    def random_items(self, rng):
+        return [
+            {"product_id": rng.randint(1, self.args.products), "quantity": 1}
+            for _ in range(rng.randint(1, 3))
+        ]
+
+    async def register_login(self, client, recorder, rng, worker, iteration):
+        email = f"load-{self.run_id}-{worker}-{iteration}@example.com"
+        credentials = {"email": email, "password": PASSWORD}
+        if await recorder.request(client, "POST /auth/register", "POST", "/auth/register", json=credentials):
+            await recorder.request(client, "POST /auth/login", "POST", "/auth/login", json=credentials)
+
+    async def browse(self, client, recorder, rng, worker, iteration):
+        await recorder.request(client, "GET /categories/", "GET", "/categories/")
+        params = {"limit": 50, "category_id": rng.randint(1, self.args.categories)}
+        page = await recorder.request(client, "GET /products/", "GET", "/products/", params=params)
+        if page and page["next_cursor"] is not None:
+            params["cursor"] = page["next_cursor"]
+            await recorder.request(client, "GET /products/ (next page)", "GET", "/products/", params=params)
+        await recorder.request(
+            client, "GET /products/search", "GET", "/products/search", params={"q": rng.choice(WORDS)}
+        )
+
+    async def add_to_cart(self, client, recorder, rng, worker, iteration):
+        user_id = self.user_for(worker, iteration)
+        await recorder.request(
+            client, "POST /cart/", "POST", "/cart/",
+            json={"products": self.random_items(rng)}, headers=self.auth(user_id)
+        )
+
+    async def checkout(self, client, recorder, rng, worker, iteration):
+        user_id = self.user_for(worker, iteration)
+        cart = await recorder.request(
+            client, "POST /cart/ (before checkout)", "POST", "/cart/",
+            json={"products": self.random_items(rng)}, headers=self.auth(user_id)
+        )
+        if cart:
+            key = f"{self.run_id}-{worker}-{iteration}"
+            await recorder.request(
+                client, "POST /cart/checkout/{id}", "POST", f"/cart/checkout/{cart['id']}",
+                headers=self.auth(user_id, **{"Idempotency-Key": key})
+            )
+
+    async def order_history(self, client, recorder, rng, worker, iteration):
+        user_id = self.user_for(worker, iteration)
+        url = f"/orders/history/{user_id}"
+        page = await recorder.request(
+            client, "GET /orders/history/{id}", "GET", url, params={"limit": 20}, headers=self.auth(user_id)
+        )
+        if page and page["next_cursor"] is not None:
+            await recorder.request(
+                client, "GET /orders/history/{id} (next page)", "GET", url,
+                params={"limit": 20, "cursor": page["next_cursor"]}, headers=self.auth(user_id)
+            )
+
+
+async def run_flow(client, flows, name: str, iterations: int, concurrency: int, seed_value: int):
+    recorder = Recorder()
+    flow = getattr(flows, name)
+    next_iteration = iter(range(iterations))
+
+    async def worker(number: int):
+        rng = random.Random(f"{seed_value}-{name}-{number}")
+        for iteration in next_iteration:
+            await flow(client, recorder, rng, number, iteration)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return summarize(recorder, iterations, elapsed)
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def summarize(recorder, iterations: int, elapsed: float):
+    steps = {}
+    for step, samples in recorder.latencies.items():
+        statuses = recorder.statuses[step]
+        steps[step] = {
+            "requests": len(samples),
+            "errors": sum(count for status, count in statuses.items() if not "200" <= status < "400"),
+            "statuses": dict(statuses),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        }
+    return {
+        "iterations": iterations,
+        "seconds": round(elapsed, 3),
+        "iterations_per_sec": round(iterations / elapsed, 1),
+        "steps": steps,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_all(app, args, run_id: str):
+    from cache import catalog_cache, NullBackend
+    if args.no_cache:
+        catalog_cache.backend = NullBackend()
+    flows = Flows(args, run_id)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    results = {}
+
+    if args.uvicorn:
+        import uvicorn
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60)
+    else:
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=60)
+
+    try:
+        async with client:
+            for name in args.flows:
+                iterations = args.auth_iterations if name == "register_login" else args.iterations
+                results[name] = await run_flow(client, flows, name, iterations, args.concurrency, args.seed)
+                print_flow(name, results[name])
+    finally:
+        if args.uvicorn:
+            server.should_exit = True
+            await serving
+        else:
+            await lifespan.__aexit__(None, None, None)
+    return results
+
+
+def print_flow(name: str, result):
+    print(f"\n{name}: {result['iterations']} iterations in {result['seconds']:.1f}s "
+          f"({result['iterations_per_sec']:.1f}/s)")
+    print(f"  {'request':<40}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for step, s in result["steps"].items():
+        print(f"  {step:<40}{s['requests']:>9}{s['errors']:>8}{s['rps']:>9.1f}"
+              f"{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def compare(results, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}); negative is faster")
+    print(f"  {'request':<60}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}")
+    for name, result in results.items():
+        old_steps = baseline["flows"].get(name, {}).get("steps", {})
+        for step, s in result["steps"].items():
+            old = old_steps.get(step)
+            if old is None:
+                continue
+            deltas = [
+                f"{(s[k] - old[k]) / old[k]:>+9.0%}" if old[k] else f"{'n/a':>9}"
+                for k in ("p50_ms", "p95_ms", "p99_ms", "rps")
+            ]
+            print(f"  {name + ': ' + step:<60}" + "".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--orders-per-user", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--iterations", type=int, default=500, help="iterations per flow")
+    parser.add_argument("--auth-iterations", type=int, default=50, help="iterations of register_login")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=list(FLOWS))
+    parser.add_argument("--uvicorn", action="store_true", help="serve over HTTP with uvicorn instead of ASGI")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the catalog cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    args.users = max(args.users, args.concurrency)
+
+    commit, dirty = git_revision()
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(os.path.join(tmp, "load.db"), args)
+        # Importing main creates the schema, indexes and search triggers on the scratch database
+        import main as app_main
+        from database import engine
+        start = time.perf_counter()
+        seed(engine, args, random.Random(args.seed))
+        print(f"Seeded {args.products} products, {args.users} users, "
+              f"{args.users * args.orders_per_user} orders in {time.perf_counter() - start:.1f}s; "
+              f"{args.concurrency} concurrent users over {'uvicorn' if args.uvicorn else 'ASGI'}")
+        results = asyncio.run(run_all(app_main.app, args, run_id))
+        engine.dispose()
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": run_id,
+        "python": platform.python_version(),
+        "config": vars(args),
+        "flows": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{commit or 'unknown'}-{run_id}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0 if all(s["errors"] == 0 for r in results.values() for s in r["steps"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""SELECT count check for the catalog, cart and order endpoints.
+
+Seeds a throwaway SQLite database at two sizes and asserts that every endpoint
+issues the same number of SELECT statements regardless of how many rows it
+serializes, i.e. that no relationship is lazy-loaded per row (N+1). Writes are
+not counted: inserting N cart items legitimately costs N rows.
+
+Run from the project root:
+    python -m benchmarks.query_counts
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+
+from benchmarks.common import build_app, create_database, open_database, seed_catalog
+from cache import catalog_cache, NullBackend
+from routers.auth import create_token, token_cache
+import routers.products as products
+import routers.cart as cart
+import routers.orders as orders
+import models
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.count += 1
+
+    @contextmanager
+    def measure(self):
+        self.count = 0
+        yield self
+
+
+def seed_and_build_app(n_rows: int, db_path: str):
+    engine = create_database(db_path, search=True)
+    with engine.begin() as conn:
+        conn.execute(insert(models.User), [
+            {"id": 1, "email": "bench@example.com", "password_hash": "x", "role": "admin"}
+        ])
+    # One product per category
+    seed_catalog(engine, n_rows, categories=n_rows, total_units=1000, remaining_units=1000, quantity=1000)
+    engine.dispose()
+
+    async_engine, session_factory = open_database(db_path)
+    return build_app(session_factory, products.router, cart.router, orders.router), async_engine
+
+
+def run_flow(n_rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        app, engine = seed_and_build_app(n_rows, os.path.join(tmp, "bench.db"))
+        counter = QueryCounter(engine)
+        token_cache.clear()
+        # Measure the database path, not the catalog cache
+        catalog_cache.backend = NullBackend()
+        # One client context = one event loop for the pooled aiosqlite connections
+        with TestClient(app) as client:
+            token = create_token({"sub": "bench@example.com", "role": "admin", "user_id": 1})
+            client.headers["Authorization"] = f"Bearer {token}"
+            return _call_endpoints(client, counter, n_rows)
+
+
+def _call_endpoints(client, counter, n_rows: int):
+    """Run every endpoint once and return {endpoint: SELECT count}."""
+    items = [{"product_id": i, "quantity": 1} for i in range(1, n_rows + 1)]
+    # The first authenticated call verifies the token and loads the user; later ones hit the token cache
+    counts = {}
+
+    def call(name, method, url, **kwargs):
+        with counter.measure():
+            response = client.request(method, url, **kwargs)
+        assert response.status_code == 200, (name, response.text)
+        counts[name] = counter.count
+        return response.json()
+
+    call("GET /products/", "GET", "/products/", params={"limit": 200})
+    # Every seeded product is named "Product N", so the search serializes all of them
+    found = call("GET /products/search", "GET", "/products/search", params={"q": "product", "limit": 100})
+    assert len(found["items"]) == min(n_rows, 100), ("GET /products/search", found["total"])
+    first_cart = call("POST /cart/", "POST", "/cart/", json={"products": items})
+    call("GET /cart/user/{id}", "GET", "/cart/user/1")
+    call("POST /cart/checkout/{id}", "POST", f"/cart/checkout/{first_cart['id']}")
+    second_cart = call("POST /cart/ (2)", "POST", "/cart/", json={"products": items})
+    call("POST /orders/", "POST", "/orders/", json={"cart_id": second_cart["id"]})
+    call("GET /orders/", "GET", "/orders/")
+    call("GET /orders/details/{id}", "GET", "/orders/details/1")
+    call("GET /orders/history", "GET", "/orders/history")
+    page = call("GET /orders/history/{id}", "GET", "/orders/history/1", params={"limit": 1})
+    call("GET /orders/history/{id} (2)", "GET", "/orders/history/1",
+         params={"limit": 1, "cursor": page["next_cursor"]})
+    return counts
+
+
+def main():
+    small, large = 1, 50
+    small_counts, large_counts = run_flow(small), run_flow(large)
+
+    print(f"{'endpoint':<32}{f'{small} row':>10}{f'{large} rows':>10}")
+    failed = False
+    for name, count in small_counts.items():
+        marker = "" if large_counts[name] == count else "  <-- grows with rows"
+        failed = failed or bool(marker)
+        print(f"{name:<32}{count:>10}{large_counts[name]:>10}{marker}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
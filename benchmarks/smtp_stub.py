@@ -0,0 +1,109 @@
+"""A local SMTP server that accepts (or refuses) mail and keeps it in memory.
+
+Enough of SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+No TLS or AUTH, so leave SMTP_STARTTLS and SMTP_USER unset when pointing
+the app at it. Run it on its own to watch the emails the app sends:
+
+    python -m benchmarks.smtp_stub --port 1025
+    SMTP_HOST=localhost SMTP_PORT=1025 uvicorn main:app
+
+or start SMTPStub in a script (see benchmarks/bench_jobs.py). ``fail_next``
+makes the next N messages get a temporary 451 error, and ``latency`` delays
+every reply to DATA, like a slow relay would.
+"""
+import argparse
+import asyncio
+from email import message_from_bytes
+
+
+class SMTPStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_next = 0
+        self.refused = 0
+        # email.message.Message objects, in arrival order
+        self.messages = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader, writer):
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        await reply("220 smtp-stub ready")
+        recipients = []
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    await reply("250 smtp-stub")
+                elif command == b"MAIL":
+                    recipients = []
+                    await reply("250 OK")
+                elif command == b"RCPT":
+                    recipients.append(line[8:].strip().decode())
+                    await reply("250 OK")
+                elif command == b"DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while (body_line := await reader.readline()) not in (b".\r\n", b""):
+                        # Undo dot-stuffing
+                        data.append(body_line[1:] if body_line.startswith(b"..") else body_line)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    if self.fail_next > 0:
+                        self.fail_next -= 1
+                        self.refused += 1
+                        await reply("451 Try again later")
+                    else:
+                        self.messages.append(message_from_bytes(b"".join(data)))
+                        await reply("250 Queued")
+                elif command in (b"RSET", b"NOOP"):
+                    await reply("250 OK")
+                elif command == b"QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    stub = await SMTPStub(args.host, args.port, args.latency).start()
+    stub.fail_next = args.fail_next
+    print(f"SMTP stub listening on {args.host}:{stub.port}")
+    seen = 0
+    while True:
+        await asyncio.sleep(0.2)
+        for message in stub.messages[seen:]:
+            print(f"To: {message['To']}  Subject: {message['Subject']}")
+        seen = len(stub.messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before answering DATA")
+    parser.add_argument("--fail-next", type=int, default=0, help="refuse this many messages with 451 first")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import csv
+import io
+import os
+import orjson
+from fastapi import HTTPException, Request
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import catalog_cache
+from database import upsert_insert
+from reservations import stock_index
+import models
+import schemas
+
+# Rows validated and written per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Row errors listed in the report; the rest are only counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+_CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+_PRODUCT_COLUMNS = (
+    "name", "description", "price", "category_id", "total_units", "remaining_units", "quantity"
+)
+
+_PRODUCT_FIELDS = set(_PRODUCT_COLUMNS)
+
+_rows_adapter = TypeAdapter(list[schemas.ProductImportRow])
+
+
+class _Invalid:
+    """Stands in for a record that could not even be parsed."""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+async def _json_records(request: Request):
+    try:
+        records = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {exc}")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of products")
+    for record in records:
+        yield record
+
+
+async def _ndjson_records(request: Request):
+    # Parsed line by line as the body arrives
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_json_line(line)
+    if pending.strip():
+        yield _parse_json_line(pending)
+
+
+def _parse_json_line(line: bytes):
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError as exc:
+        return _Invalid(f"Invalid JSON: {exc}")
+
+
+async def _csv_records(request: Request):
+    body = (await request.body()).decode("utf-8-sig")
+    for record in csv.DictReader(io.StringIO(body)):
+        # Empty cells mean "not given"; a None key holds cells beyond the header
+        yield {key: value for key, value in record.items() if key is not None and value != ""}
+
+
+_READERS = {"json": _json_records, "ndjson": _ndjson_records, "csv": _csv_records}
+
+
+def _records(request: Request):
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    fmt = _CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415, detail="Send application/json, application/x-ndjson or text/csv"
+        )
+    return _READERS[fmt](request)
+
+
+def _format_error(error):
+    location = ".".join(str(part) for part in error["loc"][1:])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _validate(batch):
+    """Validate a batch of (row_number, record) in one pass; return the valid rows and the errors."""
+    errors = {}
+    records = []
+    for row, record in batch:
+        if isinstance(record, _Invalid):
+            errors[row] = [record.message]
+        else:
+            records.append((row, record))
+
+    try:
+        rows = _rows_adapter.validate_python([record for _, record in records])
+    except ValidationError as exc:
+        bad = {}
+        for error in exc.errors():
+            bad.setdefault(error["loc"][0], []).append(_format_error(error))
+        for index, messages in bad.items():
+            errors[records[index][0]] = messages
+        records = [entry for index, entry in enumerate(records) if index not in bad]
+        # Everything left is known to be valid
+        rows = _rows_adapter.validate_python([record for _, record in records])
+
+    return [(row, product) for (row, _), product in zip(records, rows)], errors
+
+
+class ProductImporter:
+    """Imports products in batches: validate, resolve categories with one query
+    per batch (remembering what it has seen), then bulk insert/upsert and commit.
+    """
+
+    def __init__(self, db: AsyncSession, create_categories: bool = False):
+        self.db = db
+        self.create_categories = create_categories
+        self.category_ids = {}      # name -> id
+        self.known_ids = set()      # category ids checked to exist
+        self.received = 0
+        self.imported = 0
+        self.categories_created = 0
+        self.errors = []
+        self.failed = 0
+
+    def _fail(self, row: int, messages):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "errors": messages})
+
+    async def _resolve_names(self, names):
+        missing = names - self.category_ids.keys()
+        if not missing:
+            return
+        found = await self.db.execute(
+            select(models.Category.name, models.Category.id).where(models.Category.name.in_(missing))
+        )
+        self.category_ids.update(found.tuples().all())
+        missing -= self.category_ids.keys()
+        if missing and self.create_categories:
+            created = await self.db.execute(
+                insert(models.Category).returning(models.Category.name, models.Category.id),
+                [{"name": name} for name in sorted(missing)]
+            )
+            created = created.tuples().all()
+            self.category_ids.update(created)
+            self.categories_created += len(created)
+
+    async def _check_ids(self, ids):
+        missing = ids - self.known_ids
+        if missing:
+            self.known_ids.update(
+                await self.db.scalars(select(models.Category.id).where(models.Category.id.in_(missing)))
+            )
+
+    async def _write(self, rows):
+        new = [row for row in rows if "id" not in row]
+        existing = [row for row in rows if "id" in row]
+        if new:
+            # Core insert on the table: plain executemany, without the ORM bulk bookkeeping
+            await self.db.execute(insert(models.Product.__table__), new)
+        if existing:
+            statement = upsert_insert(self.db.get_bind(), models.Product.__table__)
+            if statement is None:
+                for row in existing:
+                    await self.db.merge(models.Product(**row))
+            else:
+                statement = statement.on_conflict_do_update(
+                    index_elements=[models.Product.__table__.c.id],
+                    set_={column: statement.excluded[column] for column in _PRODUCT_COLUMNS}
+                )
+                await self.db.execute(statement, existing)
+            if self.db.get_bind().dialect.name == "postgresql":
+                # Rows inserted with an explicit id don't advance the id sequence;
+                # move it past them so later inserts don't collide
+                await self.db.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('products', 'id'), "
+                    "(SELECT max(id) FROM products))"
+                ))
+
+    async def import_batch(self, batch):
+        self.received += len(batch)
+        valid, errors = _validate(batch)
+
+        await self._resolve_names({p.category for _, p in valid if p.category_id is None})
+        await self._check_ids({p.category_id for _, p in valid if p.category_id is not None})
+
+        rows = []
+        for row, product in valid:
+            category_id = product.category_id
+            if category_id is None:
+                category_id = self.category_ids.get(product.category)
+                if category_id is None:
+                    errors[row] = [f"category: Unknown category '{product.category}'"]
+                    continue
+            elif category_id not in self.known_ids:
+                errors[row] = [f"category_id: Category {category_id} does not exist"]
+                continue
+            values = product.model_dump(include=_PRODUCT_FIELDS)
+            values["category_id"] = category_id
+            if values["remaining_units"] is None:
+                values["remaining_units"] = values["total_units"]
+            if product.id is not None:
+                values["id"] = product.id
+            rows.append(values)
+
+        try:
+            if rows:
+                await self._write(rows)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        self.imported += len(rows)
+        for row in sorted(errors):
+            self._fail(row, errors[row])
+
+    async def run(self, records):
+        batch = []
+        row = 0
+        async for record in records:
+            row += 1
+            batch.append((row, record))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await self.import_batch(batch)
+                batch = []
+        if batch:
+            await self.import_batch(batch)
+
+    def report(self):
+        return {
+            "received": self.received,
+            "imported": self.imported,
+            "failed": self.failed,
+            "categories_created": self.categories_created,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def import_products(request: Request, db: AsyncSession, create_categories: bool = False):
+    """Import the products in the request body (JSON array, NDJSON or CSV) and return the report.
+
+    Each batch is its own transaction, so if the database fails midway the
+    batches before it stay imported.
+    """
+    importer = ProductImporter(db, create_categories=create_categories)
+    try:
+        await importer.run(_records(request))
+    finally:
+        if importer.imported:
+            # Upserts may have reset remaining_units
+            stock_index.forget()
+            await catalog_cache.invalidate("products")
+        if importer.categories_created:
+            await catalog_cache.invalidate("categories")
+    return importer.report()
@@ -0,0 +1,203 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from shared_state import shared_counters
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+def _initial_counter():
+    # Counters start from the clock (ms) rather than 0, so versions handed out
+    # before a restart (e.g. in ETags) are unlikely to be reissued for
+    # different data afterwards. Memory counters start over with each process
+    # (each serve.py run when shared): a version comes back only if the old
+    # process invalidated more times than milliseconds passed between the two
+    # starts. Only RedisBackend keeps its counters across restarts.
+    return int(time.time() * 1000)
+
+
+class MemoryBackend:
+    """Per-process backend. Values are stored as-is, so callers must not mutate them.
+
+    With ``counters`` (a shared_state.SharedCounters) the version counters are
+    shared by all worker processes, so an invalidation in one worker is seen
+    by every other; the cached values themselves stay per process.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, counters=None):
+        self._entries = TTLCache(maxsize, ttl)
+        self._counters = {}
+        self._shared = counters
+        self._initial = _initial_counter()
+
+    async def get(self, key):
+        return self._entries.get(key)
+
+    async def set(self, key, value):
+        self._entries.set(key, value)
+
+    async def delete(self, key):
+        self._entries.pop(key)
+
+    async def get_counter(self, key):
+        if self._shared is not None:
+            value = self._shared.get(key)
+            # The first worker to read a counter sets its start for all of them
+            return value if value is not None else self._shared.add(key, 0, initial=self._initial)
+        return self._counters.get(key, self._initial)
+
+    async def incr(self, key):
+        if self._shared is not None:
+            self._shared.add(key, 1, initial=self._initial)
+        else:
+            self._counters[key] = self._counters.get(key, self._initial) + 1
+
+
+class NullBackend(MemoryBackend):
+    """Caches nothing (CACHE_BACKEND=none), e.g. to benchmark the database path.
+    Version counters still work."""
+
+    def __init__(self, counters=None):
+        super().__init__(maxsize=0, ttl=0, counters=counters)
+
+    async def set(self, key, value):
+        pass
+
+
+class RedisBackend:
+    """Shared backend for any client with the redis.asyncio get/set/delete/incr API
+    (redis-py, or fakeredis in tests). Values are stored as JSON."""
+
+    def __init__(self, client, ttl: float):
+        self.client = client
+        self.ttl = ttl
+
+    async def get(self, key):
+        raw = await self.client.get(key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(key, json.dumps(value, default=str), ex=int(self.ttl))
+
+    async def delete(self, key):
+        await self.client.delete(key)
+
+    async def get_counter(self, key):
+        value = await self.client.get(key)
+        if value is None:
+            await self.client.set(key, _initial_counter(), nx=True)
+            value = await self.client.get(key)
+        return int(value)
+
+    async def incr(self, key):
+        await self.get_counter(key)
+        await self.client.incr(key)
+
+
+class ReadThroughCache:
+    """Read-through cache split into namespaces.
+
+    Each namespace carries a generation counter that is part of every key, so
+    invalidating a whole namespace is a single increment; stale entries are
+    never read again and age out through TTL/LRU.
+    """
+
+    def __init__(self, backend, prefix: str = "cache"):
+        self.backend = backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def version(self, namespace: str):
+        """Current generation of ``namespace``; changes on every namespace-wide invalidation."""
+        return await self.backend.get_counter(f"{self.prefix}:{namespace}:gen")
+
+    async def _key(self, namespace: str, key):
+        return f"{self.prefix}:{namespace}:{await self.version(namespace)}:{key}"
+
+    async def get_or_load(self, namespace: str, key, loader):
+        """Return the cached value, or await ``loader()`` and cache its result."""
+        cache_key = await self._key(namespace, key)
+        value = await self.backend.get(cache_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await loader()
+        await self.backend.set(cache_key, value)
+        return value
+
+    async def invalidate(self, namespace: str, key=None):
+        """Drop one key, or the whole namespace when ``key`` is None."""
+        if key is None:
+            await self.backend.incr(f"{self.prefix}:{namespace}:gen")
+        else:
+            await self.backend.delete(await self._key(namespace, key))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_backend(kind: str = CACHE_BACKEND):
+    if kind == "redis":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+        return RedisBackend(redis.from_url(REDIS_URL), CACHE_TTL)
+    if kind == "none":
+        return NullBackend(shared_counters("cache"))
+    return MemoryBackend(CACHE_MAX_ENTRIES, CACHE_TTL, shared_counters("cache"))
+
+
+# Categories and the product catalog. Routers invalidate it on every catalog write.
+catalog_cache = ReadThroughCache(create_backend(), prefix="catalog")
@@ -0,0 +1,87 @@
+from fastapi import HTTPException
+from sqlalchemy import insert, update, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from reservations import claim_holds, commit_stock, return_units, take_units
+from notifications import LOW_STOCK_THRESHOLD, enqueue_order_jobs
+import models
+
+
+async def place_order(db: AsyncSession, cart: models.Cart) -> models.Order:
+    """Turn a cart into a confirmed order in a single transaction.
+
+    Units held for the cart are sold; any shortfall is taken with a conditional
+    UPDATE per product, so two concurrent checkouts can never both take the
+    last unit. The order lines are written with one bulk insert, and the
+    follow-up work (confirmation email, alerts) is queued in the same
+    transaction rather than done here. ``cart.items`` should be eager-loaded with
+    their products. Nothing is committed if any step fails.
+    """
+    if not cart.items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+
+    try:
+        # Checking out frees the user's active-cart slot for a new cart
+        claimed = (await db.execute(
+            update(models.Cart)
+            .where(models.Cart.id == cart.id, models.Cart.is_checked_out == False)
+            .values(is_checked_out=True)
+        )).rowcount
+        if claimed != 1:
+            raise HTTPException(status_code=400, detail="Cart already checked out")
+
+        # Units already held for the cart are sold as they are; only the rest
+        # (holds that expired, or never existed) is taken from stock now.
+        held = await claim_holds(db, cart.id)
+        # Lock rows in a stable order so concurrent checkouts can't deadlock
+        total = 0
+        low_stock = {}
+        for item in sorted(cart.items, key=lambda ci: ci.product_id):
+            change = item.quantity - held.pop(item.product_id, 0)
+            if change > 0:
+                remaining = await take_units(db, item.product_id, change)
+                if remaining is None:
+                    remaining = await db.scalar(
+                        select(models.Product.remaining_units).where(models.Product.id == item.product_id)
+                    )
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Not enough stock for {item.product.name}. Only {remaining} left."
+                    )
+            elif change < 0:
+                remaining = await return_units(db, item.product_id, -change)
+            else:
+                remaining = item.product.remaining_units
+            # Alert once, on the order whose units (held earlier or taken now) crossed the threshold
+            if remaining is not None and remaining <= LOW_STOCK_THRESHOLD < remaining + item.quantity:
+                low_stock[item.product_id] = remaining
+            total += item.product.price * item.quantity
+        # Holds on products no longer in the cart
+        for product_id in sorted(held):
+            await return_units(db, product_id, held[product_id])
+
+        order = models.Order(
+            user_id=cart.user_id,
+            cart_id=cart.id,
+            total_amount=total,
+            order_status="confirmed"
+        )
+        db.add(order)
+        await db.flush()
+        # The lines keep the price paid, so the order stays correct when the cart or prices change
+        await db.execute(insert(models.OrderItem), [
+            {
+                "order_id": order.id,
+                "product_id": item.product_id,
+                "quantity": item.quantity,
+                "unit_price": item.product.price
+            }
+            for item in cart.items
+        ])
+        enqueue_order_jobs(db, order, low_stock)
+        await commit_stock(db)
+    except Exception:
+        await db.rollback()
+        raise
+
+    await db.refresh(order)
+    return order
@@ -0,0 +1,198 @@
+import os
+import zlib
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Bodies smaller than this go out as they are: compressing them saves a few
+# bytes at best and costs CPU on every request
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Larger bodies (or stream chunks) are compressed in the threadpool, so a big
+# export or listing does not stall every other request on the event loop
+COMPRESS_THREAD_SIZE = int(os.getenv("COMPRESS_THREAD_SIZE", str(256 * 1024)))
+# Server preference, first match the client accepts wins; codings whose
+# module is not installed are skipped
+COMPRESS_ENCODINGS = [e.strip() for e in os.getenv("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+# Per-response levels: fast settings, since these run on every request
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+_COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/x-ndjson",
+                 "application/xml", "image/svg+xml")
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    if "*" in accepted:
+        accepted.update(("zstd", "br", "gzip"))
+    return accepted
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes):
+        # Sync flush: each streamed chunk reaches the client as soon as it is produced
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b""):
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes):
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self, data: bytes = b""):
+        return self._brotli.process(data) + self._brotli.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._zstd = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes):
+        return self._zstd.compress(data) + self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b""):
+        return self._zstd.compress(data) + self._zstd.flush()
+
+
+_CODECS = {
+    "gzip": lambda: _Gzip(GZIP_LEVEL),
+    "br": (lambda: _Brotli(BROTLI_QUALITY)) if brotli is not None else None,
+    "zstd": (lambda: _Zstd(ZSTD_LEVEL)) if zstandard is not None else None,
+}
+AVAILABLE_ENCODINGS = [e for e in COMPRESS_ENCODINGS if _CODECS.get(e)]
+
+
+def choose_encoding(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    return next((e for e in AVAILABLE_ENCODINGS if e in accepted), None)
+
+
+def compressor(encoding: str):
+    """A fresh streaming compressor with ``compress(chunk)`` and ``finish(last_chunk)``."""
+    return _CODECS[encoding]()
+
+
+async def _run(fn, data: bytes):
+    if len(data) >= COMPRESS_THREAD_SIZE:
+        return await run_in_threadpool(fn, data)
+    return fn(data)
+
+
+def _compressible(headers: Headers):
+    if "content-encoding" in headers or "no-transform" in headers.get("cache-control", ""):
+        return False
+    return headers.get("content-type", "").startswith(_COMPRESSIBLE)
+
+
+class CompressionMiddleware:
+    """Compresses responses with the best coding both sides support.
+
+    Whole bodies under COMPRESS_MIN_SIZE are sent as they are. Streamed
+    bodies (more than one body message) are compressed chunk by chunk as they
+    pass through, never buffered. Responses that already carry a
+    Content-Encoding, such as the precompressed pages and assets, are left
+    alone. Plain ASGI, like MetricsMiddleware, so streaming is preserved.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not AVAILABLE_ENCODINGS:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        codec = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, codec, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                if message["status"] in (204, 304) or not _compressible(headers):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held until the first body message shows how big the body is
+                    start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if codec is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                length = headers.get("content-length")
+                small = len(body) < self.minimum_size if not more_body else (
+                    length is not None and int(length) < self.minimum_size
+                )
+                if small:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                codec = compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # Same content, different bytes: the strong validator no longer applies
+                    headers["ETag"] = f"W/{etag}"
+                if more_body:
+                    del headers["content-length"]
+                else:
+                    body = await _run(codec.finish, body)
+                    headers["Content-Length"] = str(len(body))
+                    await send(dict(start, headers=headers.raw))
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(dict(start, headers=headers.raw))
+
+            body = await _run(codec.compress if more_body else codec.finish, body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,59 @@
+import csv
+import io
+import os
+from enum import Enum
+import orjson
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Rows fetched from the server-side cursor, and written to the client, per chunk.
+# Memory use depends on this, not on the size of the table.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+_MEDIA_TYPES = {ExportFormat.ndjson: "application/x-ndjson", ExportFormat.csv: "text/csv"}
+
+
+def _ndjson_chunk(columns, rows):
+    return b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def _csv_chunk(columns, rows, header: bool):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def _export_rows(db: AsyncSession, statement, fmt: ExportFormat, batch_size: int):
+    # db.stream() uses a server-side cursor; yield_per keeps only one batch of
+    # rows alive at a time. The statement should select plain columns, not ORM
+    # entities, so nothing accumulates in the session's identity map either.
+    result = await db.stream(statement.execution_options(yield_per=batch_size))
+    columns = list(result.keys())
+    first = True
+    async for rows in result.partitions():
+        if fmt is ExportFormat.csv:
+            yield _csv_chunk(columns, rows, header=first)
+        else:
+            yield _ndjson_chunk(columns, rows)
+        first = False
+    if first and fmt is ExportFormat.csv:
+        yield _csv_chunk(columns, [], header=True)
+
+
+def export_response(db: AsyncSession, statement, fmt: ExportFormat, filename: str,
+                    batch_size: int = EXPORT_BATCH_SIZE):
+    """Stream every row of ``statement`` as NDJSON (one object per line) or CSV."""
+    return StreamingResponse(
+        _export_rows(db, statement, fmt, batch_size),
+        media_type=_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt.value}"'},
+    )
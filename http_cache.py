@@ -0,0 +1,44 @@
+import os
+from fastapi import Request, Response
+from cache import catalog_cache
+
+# Browsers may reuse catalog responses for CATALOG_MAX_AGE seconds and shared
+# caches/CDNs for CATALOG_SHARED_MAX_AGE; after that they revalidate with
+# If-None-Match and usually get an empty 304.
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "30"))
+CATALOG_SHARED_MAX_AGE = int(os.getenv("CATALOG_SHARED_MAX_AGE", "60"))
+
+
+async def catalog_etag(*namespaces: str):
+    """Weak ETag built from the catalog cache versions, which every catalog write bumps."""
+    versions = [str(await catalog_cache.version(namespace)) for namespace in namespaces]
+    return f'W/"{"-".join(namespaces)}-{"-".join(versions)}"'
+
+
+def etag_matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: ignore W/ prefixes
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def catalog_cache_headers(etag: str):
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}, s-maxage={CATALOG_SHARED_MAX_AGE}",
+    }
+
+
+async def conditional_catalog_response(request: Request, response: Response, *namespaces: str):
+    """Return a 304 response when the client's copy is current, otherwise set the
+    caching headers on ``response`` and return None so the handler builds the body."""
+    etag = await catalog_etag(*namespaces)
+    headers = catalog_cache_headers(etag)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
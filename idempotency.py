@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import timedelta
+import orjson
+from fastapi import HTTPException, Response
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import upsert_insert, utcnow
+from serialization import dump, json_response
+import models
+
+logger = logging.getLogger(__name__)
+
+# How long a key's response is replayed for retries
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# How long a running request owns its key; after that a retry may take over (the first one died)
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# How often expired keys are deleted, and how many per transaction
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))
+IDEMPOTENCY_SWEEP_BATCH = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH", "1000"))
+
+
+async def _claim(db: AsyncSession, user_id: int, key: str, request_hash: str):
+    """Insert the key as running, or take over an expired one; return its id, or None if it is live."""
+    now = utcnow()
+    values = {
+        "user_id": user_id,
+        "key": key,
+        "request_hash": request_hash,
+        "status_code": None,
+        "response_body": None,
+        "expires_at": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+    }
+    statement = upsert_insert(db.get_bind(), models.IdempotencyKey).values(**values)
+    claim_id = await db.scalar(
+        statement.on_conflict_do_update(
+            index_elements=[models.IdempotencyKey.user_id, models.IdempotencyKey.key],
+            set_={name: statement.excluded[name] for name in values if name not in ("user_id", "key")},
+            where=models.IdempotencyKey.expires_at <= now
+        ).returning(models.IdempotencyKey.id)
+    )
+    await db.commit()
+    return claim_id
+
+
+async def _lookup(db: AsyncSession, user_id: int, key: str):
+    # populate_existing: a record already in the session (e.g. a stale one from
+    # the first lookup) is refreshed from the row, not returned as it was
+    record = await db.scalar(select(models.IdempotencyKey).where(
+        models.IdempotencyKey.user_id == user_id, models.IdempotencyKey.key == key
+    ).execution_options(populate_existing=True))
+    await db.commit()
+    return record
+
+
+def _replay(record, request_hash: str):
+    if record is not None and record.request_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    if record is None or record.status_code is None:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "1"}
+        )
+    return Response(
+        content=record.response_body,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+async def _store(db: AsyncSession, claim_id: int, status_code: int, content):
+    await db.execute(
+        update(models.IdempotencyKey)
+        .where(models.IdempotencyKey.id == claim_id, models.IdempotencyKey.status_code == None)
+        .values(
+            status_code=status_code,
+            response_body=orjson.dumps(content),
+            expires_at=utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        )
+    )
+    await db.commit()
+
+
+async def _release(db: AsyncSession, claim_id: int):
+    await db.rollback()
+    await db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.id == claim_id))
+    await db.commit()
+
+
+async def idempotent(db: AsyncSession, user_id: int, key, fingerprint: str, handler, adapter):
+    """Run ``handler()`` once per (user, Idempotency-Key) and replay its response to retries.
+
+    ``fingerprint`` identifies the request (endpoint and arguments); reusing a
+    key for a different one is a 422. A retry while the first request is still
+    running gets a 409. Client errors are stored and replayed like successes;
+    server errors free the key so a retry runs again. Replays only read
+    idempotency_keys. Without a key, ``handler()`` just runs.
+    """
+    if key is None:
+        return await handler()
+
+    request_hash = hashlib.sha256(fingerprint.encode()).hexdigest()
+    # Retries of a finished request are answered from a read, without taking the write lock
+    record = await _lookup(db, user_id, key)
+    if record is not None and record.expires_at > utcnow():
+        return _replay(record, request_hash)
+    claim_id = await _claim(db, user_id, key, request_hash)
+    if claim_id is None:
+        # Another request claimed the key first
+        return _replay(await _lookup(db, user_id, key), request_hash)
+
+    try:
+        content = dump(adapter, await handler())
+    except HTTPException as exc:
+        if exc.status_code >= 500:
+            await _release(db, claim_id)
+        else:
+            await db.rollback()
+            await _store(db, claim_id, exc.status_code, {"detail": exc.detail})
+        raise
+    except Exception:
+        await _release(db, claim_id)
+        raise
+    await _store(db, claim_id, 200, content)
+    return json_response(content)
+
+
+async def purge_expired_keys(db: AsyncSession, limit: int = IDEMPOTENCY_SWEEP_BATCH):
+    """Delete up to ``limit`` expired keys in one transaction; return how many were deleted."""
+    expired = (
+        select(models.IdempotencyKey.id)
+        .where(models.IdempotencyKey.expires_at <= utcnow())
+        .limit(limit)
+    )
+    deleted = (await db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.id.in_(expired))
+    )).rowcount
+    await db.commit()
+    return deleted
+
+
+async def sweep_keys(session_factory, interval: float = IDEMPOTENCY_SWEEP_INTERVAL,
+                     batch: int = IDEMPOTENCY_SWEEP_BATCH):
+    """Delete expired idempotency keys every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            async with session_factory() as db:
+                while await purge_expired_keys(db, batch) == batch:
+                    pass
+        except Exception:
+            logger.exception("Deleting expired idempotency keys failed")
+        await asyncio.sleep(interval)
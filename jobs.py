@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import timedelta
+import orjson
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import utcnow
+import models
+
+logger = logging.getLogger(__name__)
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Jobs run at the same time per process
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# How often the queue looks for due jobs when nothing woke it (retries, other processes' jobs)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Retry n waits about JOB_BACKOFF_SECONDS * 2**(n-1), capped at JOB_BACKOFF_MAX_SECONDS
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "2"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "300"))
+# A run taking longer fails (and is retried)
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "30"))
+# How long a claim lasts; past it a job is taken to be orphaned (its process died) and runs again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", str(2 * JOB_TIMEOUT_SECONDS)))
+# On shutdown, running jobs get this long to finish; the rest run again after their lease
+JOB_SHUTDOWN_GRACE_SECONDS = float(os.getenv("JOB_SHUTDOWN_GRACE_SECONDS", "5"))
+
+PENDING = "pending"
+RUNNING = "running"
+FAILED = "failed"
+
+# kind -> async handler(db, payload)
+handlers = {}
+
+# Session.info flag: the current transaction enqueued jobs
+_ENQUEUED = "jobs_enqueued"
+
+
+def job(kind: str):
+    """Register the decorated ``async def handler(db, payload)`` for jobs of ``kind``."""
+    def register(handler):
+        handlers[kind] = handler
+        return handler
+    return register
+
+
+def enqueue(db: AsyncSession, kind: str, payload: dict, delay: float = 0):
+    """Add a job to ``db``'s transaction; it exists, and runs, only once that commits."""
+    db.add(models.Job(
+        kind=kind,
+        payload=orjson.dumps(payload).decode(),
+        status=PENDING,
+        attempts=0,
+        run_after=utcnow() + timedelta(seconds=delay),
+    ))
+    db.info[_ENQUEUED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_queue(session):
+    if session.info.pop(_ENQUEUED, False):
+        queue.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_enqueued(session):
+    session.info.pop(_ENQUEUED, None)
+
+
+def backoff(attempts: int):
+    """Seconds before retry number ``attempts``, with jitter so failed jobs don't retry in lockstep."""
+    delay = min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+
+async def claim_jobs(db: AsyncSession, limit: int):
+    """Mark up to ``limit`` due jobs as running and return them.
+
+    One UPDATE ... RETURNING, so two workers (or processes) never claim the
+    same job. SKIP LOCKED does the same on databases with row locks.
+    """
+    now = utcnow()
+    due = (
+        select(models.Job.id)
+        .where(models.Job.status.in_((PENDING, RUNNING)), models.Job.run_after <= now)
+        .order_by(models.Job.run_after)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    claimed = (await db.execute(
+        update(models.Job)
+        .where(models.Job.id.in_(due.scalar_subquery()))
+        .values(status=RUNNING, attempts=models.Job.attempts + 1,
+                run_after=now + timedelta(seconds=JOB_LEASE_SECONDS))
+        .returning(models.Job.id, models.Job.kind, models.Job.payload, models.Job.attempts)
+    )).all()
+    await db.commit()
+    return claimed
+
+
+async def complete_job(db: AsyncSession, job_id: int):
+    await db.execute(delete(models.Job).where(models.Job.id == job_id))
+    await db.commit()
+
+
+async def fail_job(db: AsyncSession, job_id: int, attempts: int, error: str):
+    """Schedule a retry with backoff, or mark the job failed once out of attempts."""
+    values = {"last_error": error[:2000]}
+    if attempts >= JOB_MAX_ATTEMPTS:
+        values["status"] = FAILED
+    else:
+        values["status"] = PENDING
+        values["run_after"] = utcnow() + timedelta(seconds=backoff(attempts))
+    await db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+    await db.commit()
+
+
+class JobQueue:
+    """Runs jobs from the ``jobs`` table, at most ``concurrency`` at a time.
+
+    A commit that enqueued jobs wakes the queue at once; otherwise it polls
+    every JOB_POLL_INTERVAL seconds. Polling finds retries that came due,
+    jobs enqueued by other processes and jobs orphaned by a crash. Jobs can
+    run more than once (a crash after the work, before the delete), so
+    handlers should tolerate repeats.
+    """
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, poll_interval: float = JOB_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wake = None
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self, session_factory):
+        """Claim and run due jobs until cancelled."""
+        self._wake = asyncio.Event()
+        running = set()
+
+        def finished(task):
+            running.discard(task)
+            self.notify()
+
+        try:
+            while True:
+                self._wake.clear()
+                free = self.concurrency - len(running)
+                claimed = []
+                if free > 0:
+                    try:
+                        async with session_factory() as db:
+                            claimed = await claim_jobs(db, free)
+                    except Exception:
+                        logger.exception("Claiming jobs failed")
+                for claimed_job in claimed:
+                    task = asyncio.create_task(self._run_job(session_factory, claimed_job))
+                    running.add(task)
+                    task.add_done_callback(finished)
+                if free > 0 and len(claimed) == free:
+                    # Every slot filled: more may be due
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wake = None
+            if running:
+                _, unfinished = await asyncio.wait(running, timeout=JOB_SHUTDOWN_GRACE_SECONDS)
+                for task in unfinished:
+                    task.cancel()
+
+    async def _run_job(self, session_factory, claimed_job):
+        job_id, kind, payload, attempts = claimed_job
+        try:
+            handler = handlers.get(kind)
+            if handler is None:
+                raise LookupError(f"No handler for job kind {kind!r}")
+            async with session_factory() as db:
+                await asyncio.wait_for(handler(db, orjson.loads(payload)), JOB_TIMEOUT_SECONDS)
+        except Exception as exc:
+            logger.warning("Job %s (%s) failed on attempt %s: %r", job_id, kind, attempts, exc)
+            await self._record(session_factory, fail_job, job_id, attempts, repr(exc))
+        else:
+            await self._record(session_factory, complete_job, job_id)
+
+    async def _record(self, session_factory, outcome, job_id: int, *args):
+        try:
+            async with session_factory() as db:
+                await outcome(db, job_id, *args)
+        except Exception:
+            # The claim lapses and the job runs again
+            logger.exception("Recording the outcome of job %s failed", job_id)
+
+
+queue = JobQueue()
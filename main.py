@@ -1,5 +1,8 @@
-from fastapi import FastAPI
-from database import engine, Base
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, async_engine, AsyncSessionLocal, get_async_db
 import routers.auth as auth
 import routers.category as category
 import routers.products as products
@@ -7,18 +10,56 @@ import routers.cart as cart
 import routers.orders as orders
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from migrations import PREPARE_DATABASE, prepare_database
+from passwords import shutdown_pool
+from reservations import sweep_holds
+from idempotency import sweep_keys
+from jobs import JOBS_ENABLED, queue as job_queue
+from cache import catalog_cache
+from serialization import DefaultResponse
+from pages import SSR_PAGES, Pages, StaticAssets
+from compression import COMPRESSION_ENABLED, CompressionMiddleware
+from metrics import METRICS_ENABLED, MetricsMiddleware, instrument_engine, publish_snapshots, render as render_metrics
+from shared_state import SHARED_STATE_PATH
 
-Base.metadata.create_all(bind=engine)
+# serve.py does this once before starting its workers and turns it off for them
+if PREPARE_DATABASE:
+    prepare_database(engine)
 
-app = FastAPI(title="E-commerce API (ORM Version)")
 
-# Static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background = [
+        asyncio.create_task(sweep_holds(AsyncSessionLocal)),
+        asyncio.create_task(sweep_keys(AsyncSessionLocal)),
+    ]
+    if JOBS_ENABLED:
+        background.append(asyncio.create_task(job_queue.run(AsyncSessionLocal)))
+    if METRICS_ENABLED and SHARED_STATE_PATH:
+        # Lets whichever worker answers /metrics report all of them
+        background.append(asyncio.create_task(publish_snapshots()))
+    yield
+    for task in background:
+        task.cancel()
+    # The job queue lets running jobs finish (JOB_SHUTDOWN_GRACE_SECONDS) before it exits
+    await asyncio.gather(*background, return_exceptions=True)
+    shutdown_pool()
 
-# HTML templates
+
+app = FastAPI(
+    title="E-commerce API (ORM Version)", lifespan=lifespan, default_response_class=DefaultResponse
+)
+
+# Static files, also served under content-hashed names
+assets = StaticAssets(directory="static")
+app.mount("/static", assets, name="static")
+
+# HTML templates, rendered once and served from memory
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = assets.url
+pages = Pages(templates.env)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,38 +69,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if COMPRESSION_ENABLED:
+    # Inside the metrics middleware, so response sizes are recorded as sent
+    app.add_middleware(CompressionMiddleware)
+
+if METRICS_ENABLED:
+    # Added last, so it is outermost and times everything else
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
 app.include_router(auth.router)
 app.include_router(category.router)
 app.include_router(products.router)
 app.include_router(cart.router)
 app.include_router(orders.router)
 
+
+@app.get("/cache/stats", tags=["Cache"])
+def cache_stats():
+    return catalog_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ===== ALL PAGE ROUTES =====
+# Served from memory, so async: no threadpool hop per hit. The catalog pages
+# come with their first page of data rendered in (SSR_PAGES).
 
 @app.get("/")
-def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+async def home(request: Request):
+    return pages.response(request, "index.html")
 
 @app.get("/register")
-def register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+async def register_page(request: Request):
+    return pages.response(request, "register.html")
 
 @app.get("/login")
-def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+async def login_page(request: Request):
+    return pages.response(request, "login.html")
 
 @app.get("/products")
-def products_page(request: Request):
-    return templates.TemplateResponse("products.html", {"request": request})
+async def products_page(request: Request, db: AsyncSession = Depends(get_async_db)):
+    if not SSR_PAGES:
+        return pages.response(request, "products.html")
+
+    async def load():
+        return {"products": await products.first_product_page(db)}
+
+    return await pages.catalog_response(request, "products.html", ("products",), load)
 
 @app.get("/categories")
-def categories_page(request: Request):
-    return templates.TemplateResponse("categories.html", {"request": request})
+async def categories_page(request: Request, db: AsyncSession = Depends(get_async_db)):
+    if not SSR_PAGES:
+        return pages.response(request, "categories.html")
+
+    async def load():
+        categories = await category.all_categories(db)
+        counts = await category.category_product_counts(db)
+        # Open on the first category that has products
+        selected = next((c for c in categories if counts.get(str(c["id"]))), None)
+        page = await products.first_product_page(db, category_id=selected["id"]) if selected else None
+        return {"categories": categories, "counts": counts, "selected": selected, "products": page}
+
+    return await pages.catalog_response(request, "categories.html", ("categories", "products"), load)
 
 @app.get("/search")
-def search_page(request: Request):
-    return templates.TemplateResponse("search.html", {"request": request})
+async def search_page(request: Request):
+    return pages.response(request, "search.html")
 
 @app.get("/cart")
-def cart_page(request: Request):
-    return templates.TemplateResponse("cart.html", {"request": request})
\ No newline at end of file
+async def cart_page(request: Request):
+    return pages.response(request, "cart.html")
\ No newline at end of file
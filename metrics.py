@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+import orjson
+from sqlalchemy import event
+from shared_state import SHARED_STATE_PATH
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Adds "Server-Timing: app;dur=..., db;dur=..." to every response (visible in browser devtools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+# Statements slower than this are logged with the route that ran them; 0 disables the log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# With several workers, how often each saves its metrics for the others' /metrics to include
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Label for statements run outside a request (startup, sweepers)
+BACKGROUND = "background"
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "query_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    @property
+    def route(self):
+        # The router records the matched route in the scope; templates, not raw
+        # paths, keep the label set bounded. Mounts (static files) go by prefix.
+        route = self.scope.get("route")
+        if route is not None:
+            return route.path
+        return self.scope.get("root_path") or "unmatched"
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, labels: tuple, value: float):
+        self.counts[labels][bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def snapshot(self):
+        return [[list(labels), counts, self.sums[labels]] for labels, counts in self.counts.items()]
+
+    def merge(self, snapshot):
+        for labels, counts, total in snapshot:
+            labels = tuple(labels)
+            merged = self.counts[labels]
+            for i, count in enumerate(counts):
+                merged[i] += count
+            self.sums[labels] += total
+
+    def render(self, label_names):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in sorted(self.counts.items()):
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}'
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket{{{base},le="+Inf"}} {cumulative}'
+            yield f"{self.name}_sum{{{base}}} {self.sums[labels]}"
+            yield f"{self.name}_count{{{base}}} {cumulative}"
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """Process-wide request and SQL metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)        # (method, route, status) -> count
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Time from request to last response byte.", LATENCY_BUCKETS
+        )
+        self.size = Histogram("http_response_size_bytes", "Response body size.", SIZE_BUCKETS)
+        self.queries_per_request = Histogram(
+            "http_request_db_queries", "SQL statements run by one request.", QUERY_COUNT_BUCKETS
+        )
+        self.queries = defaultdict(int)         # route -> statements
+        self.query_seconds = defaultdict(float)  # route -> seconds
+        self.slow_queries = defaultdict(int)    # route -> statements over SLOW_QUERY_MS
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, size: int, queries: int):
+        with self._lock:
+            self.requests[(method, route, status)] += 1
+            self.latency.observe((method, route), seconds)
+            self.size.observe((method, route), size)
+            self.queries_per_request.observe((method, route), queries)
+
+    def record_query(self, route: str, seconds: float, slow: bool):
+        with self._lock:
+            self.queries[route] += 1
+            self.query_seconds[route] += seconds
+            if slow:
+                self.slow_queries[route] += 1
+
+    def snapshot(self):
+        """Everything recorded so far, as JSON-compatible data for merge()."""
+        with self._lock:
+            return {
+                "requests": [[*labels, count] for labels, count in self.requests.items()],
+                "latency": self.latency.snapshot(),
+                "size": self.size.snapshot(),
+                "queries_per_request": self.queries_per_request.snapshot(),
+                "queries": dict(self.queries),
+                "query_seconds": dict(self.query_seconds),
+                "slow_queries": dict(self.slow_queries),
+            }
+
+    def merge(self, snapshot):
+        """Add another registry's snapshot() to this one."""
+        with self._lock:
+            for *labels, count in snapshot["requests"]:
+                self.requests[tuple(labels)] += count
+            self.latency.merge(snapshot["latency"])
+            self.size.merge(snapshot["size"])
+            self.queries_per_request.merge(snapshot["queries_per_request"])
+            for name in ("queries", "query_seconds", "slow_queries"):
+                totals = getattr(self, name)
+                for route, value in snapshot[name].items():
+                    totals[route] += value
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP http_requests_total Requests handled.",
+                "# TYPE http_requests_total counter",
+            ]
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), labels)}}} {count}")
+            lines.extend(self.latency.render(("method", "route")))
+            lines.extend(self.size.render(("method", "route")))
+            lines.extend(self.queries_per_request.render(("method", "route")))
+            for name, help_text, values in (
+                ("db_queries_total", "SQL statements executed.", self.queries),
+                ("db_query_seconds_total", "Time spent executing SQL statements.", self.query_seconds),
+                ("db_slow_queries_total", f"SQL statements slower than {SLOW_QUERY_MS:g} ms.", self.slow_queries),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for route, value in sorted(values.items()):
+                    lines.append(f'{name}{{route="{_escape(route)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _snapshot_dir():
+    return os.path.join(SHARED_STATE_PATH, "metrics")
+
+
+def write_snapshot():
+    """Save this worker's metrics where the other workers' /metrics can read them."""
+    os.makedirs(_snapshot_dir(), exist_ok=True)
+    path = os.path.join(_snapshot_dir(), f"{os.getpid()}.json")
+    with open(path + ".tmp", "wb") as f:
+        f.write(orjson.dumps(registry.snapshot()))
+    # Atomic, so a reader never sees half a file
+    os.replace(path + ".tmp", path)
+
+
+async def publish_snapshots(interval: float = METRICS_SNAPSHOT_INTERVAL):
+    """Write this worker's snapshot every ``interval`` seconds, and once more when cancelled."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError:
+                logger.exception("Writing the metrics snapshot failed")
+    finally:
+        write_snapshot()
+
+
+def render():
+    """The metrics of this process, or of every worker when several share SHARED_STATE_PATH.
+
+    Other workers are read from their last snapshot, so their figures lag by
+    up to METRICS_SNAPSHOT_INTERVAL. Snapshots of workers that exited stay
+    in, so totals never go backwards.
+    """
+    if not SHARED_STATE_PATH:
+        return registry.render()
+    combined = Registry()
+    combined.merge(registry.snapshot())
+    own = f"{os.getpid()}.json"
+    directory = _snapshot_dir()
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name.endswith(".json") and name != own:
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    combined.merge(orjson.loads(f.read()))
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable metrics snapshot %s", name)
+    return combined.render()
+
+
+# The start time lives on the statement's execution context rather than the
+# connection, so a statement that raises (and never reaches _after_execute)
+# leaves nothing behind to be mistaken for a later statement's start.
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "metrics_query_start", None)
+    if start is None:
+        return
+    seconds = time.perf_counter() - start
+    stats = _current.get()
+    route = BACKGROUND
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += seconds
+        route = stats.route
+    slow = SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS
+    if slow:
+        logger.warning("Slow query (%.1f ms, %s): %s", seconds * 1000, route, " ".join(statement.split())[:500])
+    registry.record_query(route, seconds, slow)
+
+
+def instrument_engine(engine):
+    """Count and time every statement ``engine`` runs (pass ``async_engine.sync_engine`` for async ones)."""
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+def _server_timing(elapsed: float, stats: RequestStats):
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries"'
+    ).encode()
+
+
+class MetricsMiddleware:
+    """Records latency, status, response size and SQL statements per route.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses pass
+    through untouched and their full size and duration are measured. The
+    Server-Timing header reflects the time and queries up to the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(time.perf_counter() - start, stats)))
+                    message = dict(message, headers=headers)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            _current.reset(token)
+            registry.record_request(
+                scope["method"], stats.route, status, time.perf_counter() - start, size, stats.queries
+            )
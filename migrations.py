@@ -0,0 +1,88 @@
+import os
+from sqlalchemy import inspect, select, text, update
+from database import Base, create_indexes
+from search import init_search_index
+import models
+
+# Create/migrate the schema when main is imported; serve.py does it once up front instead
+PREPARE_DATABASE = os.getenv("PREPARE_DATABASE", "true").lower() in ("1", "true", "yes")
+
+
+def prepare_database(engine):
+    """Create and migrate the schema. Every step is idempotent."""
+    Base.metadata.create_all(bind=engine)
+    consolidate_carts(engine)
+    create_indexes()
+    init_search_index(engine)
+    backfill_order_items(engine)
+
+
+def backfill_order_items(engine):
+    """Give orders placed before order_items existed their lines.
+
+    Those orders point at a snapshot cart whose cart_items hold what was bought.
+    The price paid was never stored, so the product's current price is used.
+    Orders that already have lines are skipped, so this is safe to run on
+    every start.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+            SELECT o.id, ci.product_id, ci.quantity, p.price
+            FROM orders o
+            JOIN cart_items ci ON ci.cart_id = o.cart_id
+            JOIN products p ON p.id = ci.product_id
+            WHERE NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.id)
+            ORDER BY o.id, ci.id
+        """))
+
+
+def consolidate_carts(engine):
+    """Bring carts from before one-active-cart-per-user in line with its unique indexes.
+
+    Carts ordered through POST /orders/ used to stay active; they are marked
+    checked out. Of the remaining active carts each user keeps the newest as it
+    is. The older ones were left behind when add-to-cart and checkout started a
+    new cart each time, so they hold abandoned or already bought items: they
+    are marked checked out too, not merged. Repeated products in a cart are
+    merged into one line. Must run before create_indexes(); does nothing once
+    the indexes exist.
+    """
+    with engine.begin() as conn:
+        existing = {index["name"] for index in inspect(conn).get_indexes("carts")}
+        existing |= {index["name"] for index in inspect(conn).get_indexes("cart_items")}
+        if {"ix_carts_active_user_id", "ix_cart_items_cart_id_product_id"} <= existing:
+            return
+
+        conn.execute(
+            update(models.Cart)
+            .where(models.Cart.is_checked_out == False, models.Cart.id.in_(select(models.Order.cart_id)))
+            .values(is_checked_out=True)
+        )
+
+        active = conn.execute(
+            select(models.Cart.user_id, models.Cart.id)
+            .where(models.Cart.is_checked_out == False)
+            .order_by(models.Cart.user_id, models.Cart.id.desc())
+        )
+        keep = set()
+        stale = []
+        for user_id, cart_id in active:
+            if user_id in keep:
+                stale.append(cart_id)
+            else:
+                keep.add(user_id)
+        if stale:
+            conn.execute(update(models.Cart).where(models.Cart.id.in_(stale)).values(is_checked_out=True))
+
+        conn.execute(text("""
+            UPDATE cart_items SET quantity = (
+                SELECT sum(c2.quantity) FROM cart_items c2
+                WHERE c2.cart_id = cart_items.cart_id AND c2.product_id = cart_items.product_id
+            )
+            WHERE id IN (SELECT min(id) FROM cart_items GROUP BY cart_id, product_id HAVING count(*) > 1)
+        """))
+        conn.execute(text("""
+            DELETE FROM cart_items
+            WHERE id NOT IN (SELECT min(id) FROM cart_items GROUP BY cart_id, product_id)
+        """))
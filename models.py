@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime, Boolean, func
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime, Boolean, Index, LargeBinary, func
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -35,6 +35,23 @@ class Product(Base):
     category = relationship("Category", back_populates="products")
     cart_items = relationship("CartItem", back_populates="product")
 
+    # Keyset pagination walks products in id order, optionally inside one category,
+    # within a price range or over in-stock rows only.
+    __table_args__ = (
+        Index("ix_products_category_id_id", "category_id", "id"),
+        Index("ix_products_category_id_price", "category_id", "price"),
+        Index(
+            "ix_products_in_stock_category_id_id", "category_id", "id",
+            sqlite_where=remaining_units > 0,
+            postgresql_where=remaining_units > 0
+        ),
+    )
+
+    @property
+    def stock_status(self):
+        # Lets schemas.ProductOut validate straight from a Product row
+        return "Out of Stock" if self.remaining_units == 0 else "Available"
+
 
 class Cart(Base):
     __tablename__ = "carts"
@@ -47,6 +64,15 @@ class Cart(Base):
     items = relationship("CartItem", back_populates="cart")
     order = relationship("Order", back_populates="cart", uselist=False)
 
+    # At most one active cart per user, found with a single index lookup
+    __table_args__ = (
+        Index(
+            "ix_carts_active_user_id", "user_id", unique=True,
+            sqlite_where=is_checked_out == False,
+            postgresql_where=is_checked_out == False
+        ),
+    )
+
 
 class CartItem(Base):
     __tablename__ = "cart_items"
@@ -58,6 +84,11 @@ class CartItem(Base):
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product", back_populates="cart_items")
 
+    # One line per product, updated in place; also serves loading a cart's items
+    __table_args__ = (
+        Index("ix_cart_items_cart_id_product_id", "cart_id", "product_id", unique=True),
+    )
+
 
 class Order(Base):
     __tablename__ = "orders"
@@ -70,3 +101,86 @@ class Order(Base):
 
     user = relationship("User", back_populates="orders")
     cart = relationship("Cart", back_populates="order")
+    items = relationship("OrderItem", back_populates="order")
+
+    # Order history pages walk (order_time, id) newest first, per customer or per status
+    __table_args__ = (
+        Index("ix_orders_user_id_order_time_id", "user_id", "order_time", "id"),
+        Index("ix_orders_order_status_order_time_id", "order_status", "order_time", "id"),
+    )
+
+
+class OrderItem(Base):
+    """One line of an order, with the price paid at checkout."""
+    __tablename__ = "order_items"
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+
+    order = relationship("Order", back_populates="items")
+    product = relationship("Product")
+
+
+class StockHold(Base):
+    """Units of a product set aside for a cart until ``expires_at``.
+
+    Held units are already taken off Product.remaining_units; checkout sells
+    them, and the sweeper in reservations.py returns them once expired.
+    """
+    __tablename__ = "stock_holds"
+    id = Column(Integer, primary_key=True)
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_stock_holds_cart_id_product_id", "cart_id", "product_id", unique=True),
+        Index("ix_stock_holds_expires_at", "expires_at"),
+    )
+
+
+class IdempotencyKey(Base):
+    """A client's Idempotency-Key and the response its first request got.
+
+    ``status_code`` stays NULL while that request is running. Retries within
+    ``expires_at`` get the stored response back; idempotency.py sweeps the rest.
+    """
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer)
+    response_body = Column(LargeBinary)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotency_keys_user_id_key", "user_id", "key", unique=True),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+
+class Job(Base):
+    """Background work written in the same transaction as the change that needs it (an outbox).
+
+    ``status`` is "pending" until a worker claims it, "running" while it
+    runs, and "failed" once out of attempts. ``run_after`` is when a pending
+    job is next due. For a running job it is when the claim lapses, so jobs
+    whose worker died are retried. Finished jobs are deleted; see jobs.py.
+    """
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False)
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
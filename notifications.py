@@ -0,0 +1,104 @@
+import logging
+import os
+import smtplib
+from email.message import EmailMessage
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+from jobs import enqueue, job
+import models
+
+logger = logging.getLogger(__name__)
+analytics_logger = logging.getLogger("analytics")
+
+# Unset: emails are logged instead of sent (local development). For a local
+# stub server: python -m benchmarks.smtp_stub --port 1025, then SMTP_HOST=localhost SMTP_PORT=1025
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "10"))
+MAIL_FROM = os.getenv("MAIL_FROM", "ShopHub <orders@shophub.local>")
+# Who gets low-stock alerts; unset disables them
+STOCK_ALERT_EMAIL = os.getenv("STOCK_ALERT_EMAIL", "")
+# A sale that leaves a product at or below this many units raises an alert
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+
+
+def _send(message: EmailMessage):
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(message)
+
+
+async def send_email(to: str, subject: str, body: str):
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    if not SMTP_HOST:
+        logger.info("Email to %s (SMTP_HOST not set, not sent): %s", to, subject)
+        return
+    # smtplib blocks; errors propagate so the job is retried
+    await run_in_threadpool(_send, message)
+
+
+def enqueue_order_jobs(db: AsyncSession, order: models.Order, low_stock: dict):
+    """Queue the follow-up work for a new order in its transaction.
+
+    ``low_stock`` maps product ids to the units left, for products the order
+    took to LOW_STOCK_THRESHOLD or below.
+    """
+    enqueue(db, "order_confirmation", {"order_id": order.id})
+    enqueue(db, "analytics_event", {
+        "event": "order_placed", "order_id": order.id, "user_id": order.user_id, "total": order.total_amount
+    })
+    if STOCK_ALERT_EMAIL:
+        for product_id, remaining in low_stock.items():
+            enqueue(db, "low_stock_alert", {"product_id": product_id, "remaining": remaining})
+
+
+@job("order_confirmation")
+async def send_order_confirmation(db: AsyncSession, payload: dict):
+    order = await db.scalar(
+        select(models.Order)
+        .options(selectinload(models.Order.user), selectinload(models.Order.items).selectinload(models.OrderItem.product))
+        .where(models.Order.id == payload["order_id"])
+    )
+    if order is None:
+        logger.warning("Order %s no longer exists, confirmation not sent", payload["order_id"])
+        return
+    lines = [
+        f"{item.quantity} x {item.product.name} at {item.unit_price:,.2f}" for item in order.items
+    ]
+    await send_email(
+        order.user.email,
+        f"Order #{order.id} confirmed",
+        "Thank you for your order.\n\n" + "\n".join(lines) + f"\n\nTotal: {order.total_amount:,.2f}\n",
+    )
+
+
+@job("low_stock_alert")
+async def send_low_stock_alert(db: AsyncSession, payload: dict):
+    product = await db.get(models.Product, payload["product_id"])
+    if product is None:
+        return
+    await send_email(
+        STOCK_ALERT_EMAIL,
+        f"Low stock: {product.name}",
+        f"{product.name} (#{product.id}) is down to {payload['remaining']} units "
+        f"({product.remaining_units} now).\n",
+    )
+
+
+@job("analytics_event")
+async def record_analytics_event(db: AsyncSession, payload: dict):
+    # One JSON object per line, for whatever ships the logs
+    analytics_logger.info(orjson.dumps(payload).decode())
@@ -0,0 +1,145 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from fastapi import Request, Response
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.staticfiles import StaticFiles
+from http_cache import catalog_etag
+from compression import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+# Render every page once at startup; turn off while editing templates
+PRERENDER_PAGES = os.getenv("PRERENDER_PAGES", "true").lower() in ("1", "true", "yes")
+
+# Render the first page of catalog data into /products and /categories (with an
+# inline JSON copy for the page script) instead of sending an empty shell that
+# fetches it in a second round trip
+SSR_PAGES = os.getenv("SSR_PAGES", "true").lower() in ("1", "true", "yes")
+
+# Hashed asset URLs change whenever the file does, so they can be cached for good
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Pages name the current asset URLs, so browsers revalidate them (cheap: ETag -> 304)
+REVALIDATE = "no-cache"
+
+# Preferred first
+_ENCODINGS = ("br", "gzip")
+
+
+class Precompressed:
+    """A response body kept in memory with its gzip (and brotli) variants and their ETags."""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.media_type = media_type
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.bodies = {"identity": body}
+        self.etags = {"identity": f'"{digest}"'}
+        variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=11)
+        for encoding, compressed in variants.items():
+            # Tiny bodies can grow when compressed
+            if len(compressed) < len(body):
+                self.bodies[encoding] = compressed
+                self.etags[encoding] = f'"{digest}-{encoding}"'
+
+    def response(self, request_headers: Headers, cache_control: str):
+        accepted = accepted_encodings(request_headers.get("accept-encoding"))
+        encoding = next((e for e in _ENCODINGS if e in accepted and e in self.bodies), "identity")
+        headers = {"ETag": self.etags[encoding], "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or self.etags[encoding] in if_none_match):
+            return Response(status_code=304, headers=headers)
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+class StaticAssets(StaticFiles):
+    """StaticFiles that also serves every file under a content-hashed name.
+
+    ``style.css`` is served as ``style.<hash>.css`` from memory, precompressed
+    and cacheable for a year. ``url()`` gives templates that name. The plain
+    names still work, uncompressed and revalidated, for anything that
+    hard-codes them.
+    """
+
+    def __init__(self, directory: str, prefix: str = "/static"):
+        super().__init__(directory=directory)
+        self.prefix = prefix
+        self.assets = {}
+        self.urls = {}
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, directory).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    content = f.read()
+                stem, suffix = os.path.splitext(name)
+                hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{suffix}"
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                if media_type.startswith("text/") or media_type.endswith(("javascript", "json")):
+                    media_type += "; charset=utf-8"
+                self.assets[hashed] = Precompressed(content, media_type)
+                self.urls[name] = f"{prefix}/{hashed}"
+
+    def url(self, name: str):
+        return self.urls.get(name, f"{self.prefix}/{name}")
+
+    async def get_response(self, path: str, scope):
+        asset = self.assets.get(path.replace(os.sep, "/"))
+        if asset is None:
+            return await super().get_response(path, scope)
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        return asset.response(Headers(scope=scope), IMMUTABLE)
+
+
+class Pages:
+    """Page templates rendered to bytes once, served precompressed with ETags.
+
+    The templates take no per-request context, so rendering them on every hit
+    only repeated the same work.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        env.filters.setdefault("price", format_price)
+        self.pages = {}
+        # name -> (catalog ETag, page) for the latest catalog version only
+        self.catalog_pages = {}
+        if PRERENDER_PAGES:
+            for name in env.list_templates(filter_func=lambda name: name.endswith(".html")):
+                self.pages[name] = self.render(name)
+
+    def render(self, name: str, **context):
+        return Precompressed(self.env.get_template(name).render(**context).encode(), "text/html; charset=utf-8")
+
+    def response(self, request: Request, name: str):
+        page = self.pages.get(name) or self.render(name)
+        return page.response(request.headers, REVALIDATE)
+
+    async def catalog_response(self, request: Request, name: str, namespaces, load):
+        """Serve ``name`` rendered with ``await load()`` as its ``initial`` context.
+
+        The page is rendered once per catalog version: any write to
+        ``namespaces`` changes the catalog ETag, and the next hit re-renders
+        from the (cached) catalog queries.
+        """
+        version = await catalog_etag(*namespaces)
+        cached = self.catalog_pages.get(name)
+        if cached is None or cached[0] != version or not PRERENDER_PAGES:
+            cached = (version, self.render(name, initial=await load()))
+            self.catalog_pages[name] = cached
+        return cached[1].response(request.headers, REVALIDATE)
+
+
+def format_price(value):
+    """Like the page script's ``price.toLocaleString()``: grouped, up to 3 decimals."""
+    return f"{value:,.3f}".rstrip("0").rstrip(".")
@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from shared_state import shared_counters
+
+# bcrypt cost factor. Raising it makes existing hashes "need update"; they are
+# rehashed transparently the next time their owner logs in.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashing runs in a separate process pool so it scales across cores and never
+# blocks the event loop. HASH_QUEUE_LIMIT caps the jobs queued or running.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_WORKERS * 8)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+def _encode(password: str):
+    # bcrypt only looks at the first 72 bytes
+    return password.encode("utf-8")[:72]
+
+
+def hash_password_sync(password: str):
+    return pwd_context.hash(_encode(password))
+
+
+def verify_and_update_sync(password: str, hashed: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash uses outdated settings."""
+    return pwd_context.verify_and_update(_encode(password), hashed)
+
+
+_pool = None
+_in_flight = 0
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: never fork a process that already runs an event loop and DB threads
+        _pool = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+async def _run(fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_QUEUE_LIMIT:
+        raise HashingBusy()
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str):
+    return await _run(hash_password_sync, password)
+
+
+async def verify_and_update(password: str, hashed: str):
+    return await _run(verify_and_update_sync, password, hashed)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+class LoginThrottle:
+    """Sliding-window attempt counter per key (e.g. email or client IP).
+
+    Keeps at most ``max_keys`` keys, dropping the least recently used, so
+    memory stays bounded under a flood of distinct keys.
+    """
+
+    def __init__(self, max_attempts: int, window_seconds: float, max_keys: int = 100_000):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+
+    def _recent(self, key, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window_seconds:
+            attempts.popleft()
+        return attempts
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, or 0 if it is not throttled."""
+        now = time.monotonic()
+        attempts = self._recent(key, now)
+        if not attempts or len(attempts) < self.max_attempts:
+            return 0
+        return max(1, int(attempts[0] + self.window_seconds - now) + 1)
+
+    def hit(self, key):
+        now = time.monotonic()
+        attempts = self._recent(key, now)
+        if attempts is None:
+            attempts = self._attempts[key] = deque()
+            if len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+        else:
+            self._attempts.move_to_end(key)
+        attempts.append(now)
+
+    def reset(self, key):
+        self._attempts.pop(key, None)
+
+
+class SharedLoginThrottle:
+    """LoginThrottle for several worker processes, counting in a shared_state.SharedCounters.
+
+    The sliding window is approximated from fixed windows: the previous
+    window's count, weighted by how much of it the sliding window still
+    covers, plus the current window's.
+    """
+
+    def __init__(self, counters, name: str, max_attempts: int, window_seconds: float):
+        self.counters = counters
+        self.name = name
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+
+    def _windows(self, key):
+        # Wall clock: it is the same in every process
+        now = time.time()
+        index = int(now // self.window_seconds)
+        elapsed = now - index * self.window_seconds
+        return f"{self.name}:{key}:{index}", f"{self.name}:{key}:{index - 1}", elapsed
+
+    def retry_after(self, key):
+        current, previous, elapsed = self._windows(key)
+        overlap = 1 - elapsed / self.window_seconds
+        attempts = self.counters.get(previous, 0) * overlap + self.counters.get(current, 0)
+        if attempts < self.max_attempts:
+            return 0
+        return max(1, int(self.window_seconds - elapsed) + 1)
+
+    def hit(self, key):
+        self.counters.add(self._windows(key)[0])
+
+    def reset(self, key):
+        current, previous, _ = self._windows(key)
+        self.counters.set(current, 0)
+        self.counters.set(previous, 0)
+
+
+def login_throttle(name: str, max_attempts: int, window_seconds: float):
+    """A LoginThrottle, shared by all workers when the server runs several."""
+    counters = shared_counters("login_attempts", slots=65536)
+    if counters is None:
+        return LoginThrottle(max_attempts, window_seconds)
+    return SharedLoginThrottle(counters, name, max_attempts, window_seconds)
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+from fastapi import HTTPException
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from cache import catalog_cache
+from database import upsert_insert, utcnow
+from shared_state import shared_array
+import models
+
+logger = logging.getLogger(__name__)
+
+# How long units added to a cart stay set aside for it; any cart change renews the hold
+HOLD_TTL_SECONDS = float(os.getenv("HOLD_TTL_SECONDS", "600"))
+# How often the sweeper looks for expired holds, and how many it releases per transaction
+HOLD_SWEEP_INTERVAL = float(os.getenv("HOLD_SWEEP_INTERVAL", "30"))
+HOLD_SWEEP_BATCH = int(os.getenv("HOLD_SWEEP_BATCH", "1000"))
+# Shared stock versions, one per bucket of product ids (product id % buckets).
+# More buckets: fewer products dropped from other workers' indexes per write.
+STOCK_INDEX_BUCKETS = int(os.getenv("STOCK_INDEX_BUCKETS", "4096"))
+
+# Session.info key for the stock levels written by the current transaction
+_CHANGES = "stock_changes"
+
+
+class StockIndex:
+    """Units available per product (Product.remaining_units) as last committed by this process.
+
+    Filled from the database on first read and kept current by commit_stock()
+    with the values the stock updates returned, so availability reads don't
+    query the products table. Writers that set remaining_units some other way
+    call forget().
+
+    With ``versions`` (a shared_state.SharedArray, for several worker
+    processes) every write bumps the version of its products' buckets, and a
+    read drops the products whose bucket another worker bumped since this
+    index last looked. A write keeps its own levels only if no other worker
+    bumped the bucket in between; otherwise it can't tell whose commit was
+    last, and the next read goes to the database.
+    """
+
+    def __init__(self, versions=None):
+        self._available = {}
+        self._shared = versions
+        # Product id -> the bucket version its entry in _available is current for
+        self._seen = {}
+
+    def _bucket(self, product_id: int):
+        return product_id % self._shared.length
+
+    def _check_versions(self, product_ids):
+        versions = self._shared.get_many([self._bucket(product_id) for product_id in product_ids])
+        for product_id, version in zip(product_ids, versions):
+            if self._seen.get(product_id) != version:
+                self._available.pop(product_id, None)
+                self._seen[product_id] = version
+
+    def _bump_versions(self, product_ids):
+        buckets = sorted({self._bucket(product_id) for product_id in product_ids})
+        versions = dict(zip(buckets, self._shared.add_many(buckets)))
+        bumped = {}
+        for product_id in product_ids:
+            version = versions[self._bucket(product_id)]
+            # Our bump directly follows what we last saw: no other writer in between
+            bumped[product_id] = self._seen.get(product_id) == version - 1
+            self._seen[product_id] = version
+        return bumped
+
+    async def available(self, db: AsyncSession, product_ids):
+        if self._shared is not None:
+            self._check_versions(product_ids)
+        missing = [product_id for product_id in product_ids if product_id not in self._available]
+        if missing:
+            rows = await db.execute(
+                select(models.Product.id, models.Product.remaining_units)
+                .where(models.Product.id.in_(missing))
+            )
+            for product_id, remaining in rows:
+                # A commit published while this read was in flight is newer; keep it
+                self._available.setdefault(product_id, remaining)
+        return {
+            product_id: self._available[product_id]
+            for product_id in product_ids if product_id in self._available
+        }
+
+    def update(self, levels: dict):
+        if self._shared is None:
+            self._available.update(levels)
+            return
+        for product_id, in_order in self._bump_versions(list(levels)).items():
+            if in_order:
+                self._available[product_id] = levels[product_id]
+            else:
+                self._available.pop(product_id, None)
+
+    def forget(self, product_ids=None):
+        if product_ids is None:
+            if self._shared is not None:
+                self._shared.add_many(range(self._shared.length))
+            self._available.clear()
+            self._seen.clear()
+            return
+        if self._shared is not None:
+            self._bump_versions(list(product_ids))
+        for product_id in product_ids:
+            self._available.pop(product_id, None)
+
+
+stock_index = StockIndex(shared_array("stock_versions", STOCK_INDEX_BUCKETS))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop(_CHANGES, None)
+
+
+def _record(db: AsyncSession, product_id: int, remaining: int, flipped: bool):
+    changes = db.info.setdefault(_CHANGES, {"levels": {}, "flipped": False})
+    changes["levels"][product_id] = remaining
+    changes["flipped"] = changes["flipped"] or flipped
+
+
+async def commit_stock(db: AsyncSession):
+    """Commit, then publish the stock levels the transaction wrote to the index.
+
+    Cached product listings are invalidated when a product sold out or came
+    back, since their stock_status changed.
+    """
+    changes = db.info.pop(_CHANGES, None)
+    await db.commit()
+    if changes:
+        stock_index.update(changes["levels"])
+        if changes["flipped"]:
+            await catalog_cache.invalidate("products")
+
+
+async def take_units(db: AsyncSession, product_id: int, units: int):
+    """Take ``units`` off a product's remaining stock; return what is left, or None if too few remain.
+
+    A conditional UPDATE, so two transactions can never both take the last unit.
+    """
+    remaining = (await db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id, models.Product.remaining_units >= units)
+        .values(remaining_units=models.Product.remaining_units - units)
+        .returning(models.Product.remaining_units)
+    )).scalar_one_or_none()
+    if remaining is not None:
+        _record(db, product_id, remaining, flipped=remaining == 0)
+    return remaining
+
+
+async def return_units(db: AsyncSession, product_id: int, units: int):
+    remaining = (await db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(remaining_units=models.Product.remaining_units + units)
+        .returning(models.Product.remaining_units)
+    )).scalar_one_or_none()
+    if remaining is not None:
+        _record(db, product_id, remaining, flipped=remaining == units)
+    return remaining
+
+
+async def _current_holds(db: AsyncSession, cart_id: int, product_ids):
+    rows = await db.execute(
+        select(models.StockHold.product_id, models.StockHold.quantity)
+        .where(models.StockHold.cart_id == cart_id, models.StockHold.product_id.in_(product_ids))
+    )
+    return dict(rows.tuples().all())
+
+
+def _expiry():
+    return utcnow() + timedelta(seconds=HOLD_TTL_SECONDS)
+
+
+async def hold_units(db: AsyncSession, cart_id: int, quantities: dict):
+    """Make the cart's holds match ``quantities`` (product_id -> units in the cart).
+
+    Only the difference from what is already held is taken from or returned
+    to stock, and every hold of the cart gets a fresh expiry. Raises 400 if a
+    product does not have enough units left; the caller must then roll back.
+    """
+    held = await _current_holds(db, cart_id, quantities)
+    # Products in id order, so concurrent carts lock rows in the same order
+    for product_id in sorted(quantities):
+        change = quantities[product_id] - held.get(product_id, 0)
+        if change > 0:
+            if await take_units(db, product_id, change) is None:
+                available = (await stock_index.available(db, [product_id])).get(product_id, 0)
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Not enough stock for product {product_id}. Only {available} more available."
+                )
+        elif change < 0:
+            await return_units(db, product_id, -change)
+
+    expires_at = _expiry()
+    statement = upsert_insert(db.get_bind(), models.StockHold)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[models.StockHold.cart_id, models.StockHold.product_id],
+            set_={"quantity": statement.excluded.quantity, "expires_at": statement.excluded.expires_at}
+        ),
+        [
+            {"cart_id": cart_id, "product_id": product_id, "quantity": quantity, "expires_at": expires_at}
+            for product_id, quantity in quantities.items()
+        ]
+    )
+    await db.execute(
+        update(models.StockHold).where(models.StockHold.cart_id == cart_id).values(expires_at=expires_at)
+    )
+
+
+async def release_holds(db: AsyncSession, cart_id: int, product_ids=None):
+    """Delete the cart's holds (or those on ``product_ids``) and return their units to stock.
+
+    Returns the released units per product.
+    """
+    statement = delete(models.StockHold).where(models.StockHold.cart_id == cart_id)
+    if product_ids is not None:
+        statement = statement.where(models.StockHold.product_id.in_(product_ids))
+    released = (await db.execute(
+        statement.returning(models.StockHold.product_id, models.StockHold.quantity)
+    )).tuples().all()
+    for product_id, units in sorted(released):
+        await return_units(db, product_id, units)
+    return dict(released)
+
+
+async def claim_holds(db: AsyncSession, cart_id: int):
+    """Delete the cart's holds without returning their units; checkout sells them instead.
+
+    Returns the held units per product. Whoever deletes a hold row first, the
+    checkout or the sweeper, owns its units.
+    """
+    claimed = await db.execute(
+        delete(models.StockHold)
+        .where(models.StockHold.cart_id == cart_id)
+        .returning(models.StockHold.product_id, models.StockHold.quantity)
+    )
+    return dict(claimed.tuples().all())
+
+
+async def release_expired(db: AsyncSession, limit: int = HOLD_SWEEP_BATCH):
+    """Release up to ``limit`` expired holds in one transaction; return how many were released."""
+    now = utcnow()
+    expired = (
+        select(models.StockHold.id)
+        .where(models.StockHold.expires_at <= now)
+        .order_by(models.StockHold.expires_at)
+        .limit(limit)
+    )
+    released = (await db.execute(
+        delete(models.StockHold)
+        .where(models.StockHold.id.in_(expired))
+        .returning(models.StockHold.product_id, models.StockHold.quantity)
+    )).tuples().all()
+    units = defaultdict(int)
+    for product_id, quantity in released:
+        units[product_id] += quantity
+    for product_id in sorted(units):
+        await return_units(db, product_id, units[product_id])
+    await commit_stock(db)
+    return len(released)
+
+
+async def sweep_holds(session_factory, interval: float = HOLD_SWEEP_INTERVAL, batch: int = HOLD_SWEEP_BATCH):
+    """Release expired holds every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            async with session_factory() as db:
+                while await release_expired(db, batch) == batch:
+                    pass
+        except Exception:
+            logger.exception("Releasing expired stock holds failed")
+        await asyncio.sleep(interval)
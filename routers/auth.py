@@ -1,31 +1,71 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from database import get_async_db
+from passwords import HashingBusy, login_throttle
+from cache import TTLCache
+import passwords
 import schemas, models
-from passlib.context import CryptContext
 import jwt
 import os
+import time
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("JWT_SECRET", "secret123")
 ALGORITHM = "HS256"
 
+# Verified token -> CurrentUser, so repeat requests skip the signature check and the
+# User lookup. Entries never outlive the token's own expiry.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("TOKEN_CACHE_TTL", "300"))
+)
+bearer_scheme = HTTPBearer(auto_error=False)
 
-def hash_password(password: str):
+# Every login/register costs a bcrypt hash, so cap attempts per email and per client IP
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+email_throttle = login_throttle("email", int(os.getenv("LOGIN_EMAIL_ATTEMPTS", "5")), LOGIN_WINDOW_SECONDS)
+ip_throttle = login_throttle("ip", int(os.getenv("LOGIN_IP_ATTEMPTS", "20")), LOGIN_WINDOW_SECONDS)
+
+
+async def hash_password(password: str):
     if not password:
         raise HTTPException(status_code=400, detail="Password cannot be empty")
-    password_bytes = password.encode("utf-8")[:72]  
-    return pwd_context.hash(password_bytes)
+    try:
+        return await passwords.hash_password(password)
+    except HashingBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
 
 
-def verify_password(password: str, hashed: str):
+async def verify_password(password: str, hashed: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash should be upgraded."""
     if not password:
-        return False
-    password_bytes = password.encode("utf-8")[:72]  
-    return pwd_context.verify(password_bytes, hashed)
+        return False, None
+    try:
+        return await passwords.verify_and_update(password, hashed)
+    except HashingBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+
+
+def throttle(*checks):
+    """Reject with 429 if any (throttle, key) pair is over its limit, else record the attempt."""
+    retry_after = max(limiter.retry_after(key) for limiter, key in checks)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(retry_after)}
+        )
+    for limiter, key in checks:
+        limiter.hit(key)
+
+
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
 
 
 def create_token(data: dict):
@@ -35,25 +75,72 @@ def create_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def _unauthorized(detail: str):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.CurrentUser:
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    token = credentials.credentials
+
+    current_user = token_cache.get(token)
+    if current_user is not None:
+        return current_user
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise _unauthorized("Invalid or expired token")
+
+    user = await db.get(models.User, claims.get("user_id"))
+    if not user:
+        raise _unauthorized("User no longer exists")
+
+    current_user = schemas.CurrentUser(id=user.id, email=user.email, role=user.role)
+    token_cache.set(token, current_user, ttl=claims.get("exp", time.time() + token_cache.ttl) - time.time())
+    return current_user
+
+
+def ensure_user_access(current_user: schemas.CurrentUser, user_id: int):
+    """Users may only act on their own data; admins on anyone's."""
+    if user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not allowed to access another user's data")
+
+
 @router.post("/register")
-def register_user(payload: schemas.RegisterIn, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(models.User.email == payload.email).first()
+async def register_user(payload: schemas.RegisterIn, request: Request, db: AsyncSession = Depends(get_async_db)):
+    throttle((ip_throttle, client_ip(request)))
+    existing_user = await db.scalar(select(models.User).where(models.User.email == payload.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_pw = hash_password(payload.password)
-    user = models.User(email=payload.email, password_hash=hashed_pw, role=payload.role)
+    hashed_pw = await hash_password(payload.password)
+    # Admins are made in the database, never by signing up
+    user = models.User(email=payload.email, password_hash=hashed_pw, role="user")
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return {"message": "User registered successfully"}
 
 
 @router.post("/login")
-def login_user(payload: schemas.LoginIn, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login_user(payload: schemas.LoginIn, request: Request, db: AsyncSession = Depends(get_async_db)):
+    throttle((ip_throttle, client_ip(request)), (email_throttle, payload.email))
+    user = await db.scalar(select(models.User).where(models.User.email == payload.email))
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_password(payload.password, user.password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    email_throttle.reset(payload.email)
+    if new_hash:
+        # bcrypt cost changed since this hash was made: upgrade it now that we know the password
+        user.password_hash = new_hash
+        await db.commit()
     
     token = create_token({"sub": user.email, "role": user.role, "user_id": user.id})
     
@@ -1,37 +1,34 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Header
+from typing import Optional
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from pydantic import TypeAdapter
+from database import get_async_db, upsert_insert
+from checkout import place_order
+from reservations import commit_stock, hold_units, release_holds, stock_index
+from routers.auth import get_current_user, ensure_user_access
+from serialization import dump, json_response
+from idempotency import idempotent
 import schemas, models
 
 router = APIRouter(prefix="/cart", tags=["Cart"])
 
+# Load a cart's items with their products and categories in one extra SELECT
+# instead of a lazy load per item.
+CART_ITEMS_WITH_PRODUCTS = (
+    selectinload(models.Cart.items)
+    .joinedload(models.CartItem.product)
+    .joinedload(models.Product.category)
+)
 
-@router.post("/", response_model=schemas.CartOut)
-def add_to_cart(payload: schemas.CartCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).get(payload.user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+cart_adapter = TypeAdapter(schemas.CartOut)
 
-    cart = models.Cart(user_id=payload.user_id)
-    db.add(cart)
-    db.commit()
-    db.refresh(cart)
 
-    for item in payload.products:
-        product = db.query(models.Product).get(item.product_id)
-        if not product:
-            raise HTTPException(status_code=400, detail=f"Product {item.product_id} not found")
-        if product.remaining_units < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Not enough stock for product {product.id}. Only {product.remaining_units} left."
-            )
-        cart_item = models.CartItem(cart_id=cart.id, product_id=product.id, quantity=item.quantity)
-        db.add(cart_item)
-    db.commit()
-    db.refresh(cart)
-
-    return {
+def serialize_cart(cart: models.Cart):
+    # Cart lines carry the quantity in the cart, not the product's own quantity,
+    # so they are built by hand and validated once here.
+    return dump(cart_adapter, {
         "id": cart.id,
         "user_id": cart.user_id,
         "created_at": cart.created_at,
@@ -46,113 +43,198 @@ def add_to_cart(payload: schemas.CartCreate, db: Session = Depends(get_db)):
                     "name": ci.product.category.name,
                     "description": ci.product.category.description
                 },
-                "stock_status": "Out of Stock" if ci.product.remaining_units == 0 else "Available"
+                "stock_status": ci.product.stock_status
             }
             for ci in cart.items
         ]
-    }
+    })
 
 
-@router.post("/checkout/{cart_id}", response_model=schemas.CheckoutOut)
-def checkout_cart(cart_id: int, db: Session = Depends(get_db)):
-    cart = db.query(models.Cart).get(cart_id)
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-    if cart.is_checked_out:
-        raise HTTPException(status_code=400, detail="Cart already checked out")
-    if not cart.items:
-        raise HTTPException(status_code=400, detail="Cart is empty")
-
-    total = 0
-    for item in cart.items:
-        if item.product.remaining_units < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Not enough stock for {item.product.name}. Only {item.product.remaining_units} left."
-            )
-        item.product.remaining_units -= item.quantity
-        total += item.product.price * item.quantity
-
-    # order = models.Order(user_id=cart.user_id, cart_id=cart.id, total_amount=total, order_status="confirmed")
-    # cart.is_checked_out = True
-    # db.add(order)
-    # db.commit()
-    # db.refresh(order)
-    # db.refresh(cart)
-      
-
-# Create a new cart for this order
-    order_cart = models.Cart(user_id=cart.user_id)
-    db.add(order_cart)
-    db.commit()
-    db.refresh(order_cart)
-
-    # Copy items from the original cart
-    for item in cart.items:
-        order_item = models.CartItem(
-            cart_id=order_cart.id,
-            product_id=item.product_id,
-            quantity=item.quantity
+def _active_cart_query(user_id: int):
+    # Served by the unique partial index on carts(user_id) WHERE NOT is_checked_out
+    return select(models.Cart.id).where(models.Cart.user_id == user_id, models.Cart.is_checked_out == False)
+
+
+async def _get_or_create_active_cart(db: AsyncSession, user_id: int):
+    cart_id = await db.scalar(_active_cart_query(user_id))
+    if cart_id is None:
+        # If a concurrent request creates it first, the unique index turns this into a no-op
+        cart_id = await db.scalar(
+            upsert_insert(db.get_bind(), models.Cart)
+            .values(user_id=user_id, is_checked_out=False)
+            .on_conflict_do_nothing()
+            .returning(models.Cart.id)
         )
-        db.add(order_item)
-    db.commit()
-
-    # Create the order with the new cart
-    order = models.Order(
-        user_id=cart.user_id,
-        cart_id=order_cart.id,
-        total_amount=total,
-        order_status="confirmed"
+        if cart_id is None:
+            cart_id = await db.scalar(_active_cart_query(user_id))
+    return cart_id
+
+
+async def _load_cart(db: AsyncSession, cart_id: int):
+    return await db.scalar(
+        select(models.Cart)
+        .options(CART_ITEMS_WITH_PRODUCTS)
+        .where(models.Cart.id == cart_id)
+        .execution_options(populate_existing=True)
     )
-    cart.is_checked_out = True
-    db.add(order)
-    db.commit()
-    db.refresh(order)
-    db.refresh(cart)
 
 
-    return {
-        "order_id": order.id,
-        "user_id": order.user_id,
-        "cart_id": order.cart_id,
-        "total_amount": order.total_amount,
-        "order_status": order.order_status,
-        "order_time": order.order_time.isoformat() if order.order_time else None
-    }
+async def _save_items(db: AsyncSession, cart_id: int, quantities: dict, increment: bool):
+    """Upsert one cart line per product: add to (increment) or replace its quantity.
+
+    The units are held for the cart (see reservations.hold_units), so they are
+    still there at checkout. Requests for more than is available are turned
+    away from the in-memory stock index before anything is written. Rolls back
+    if any product is short.
+    """
+    available = await stock_index.available(db, list(quantities))
+    missing = quantities.keys() - available.keys()
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Product {min(missing)} not found")
+    if increment:
+        for product_id in sorted(quantities):
+            if available[product_id] < quantities[product_id]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Not enough stock for product {product_id}. "
+                           f"Only {available[product_id]} more available."
+                )
+
+    statement = upsert_insert(db.get_bind(), models.CartItem)
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.CartItem.cart_id, models.CartItem.product_id],
+        set_={"quantity": (models.CartItem.quantity + statement.excluded.quantity) if increment
+              else statement.excluded.quantity}
+    ).returning(models.CartItem.product_id, models.CartItem.quantity)
+    saved = (await db.execute(statement, [
+        {"cart_id": cart_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in quantities.items()
+    ])).tuples().all()
+
+    try:
+        await hold_units(db, cart_id, dict(saved))
+    except HTTPException:
+        await db.rollback()
+        raise
 
 
-@router.get("/user/{user_id}", response_model=schemas.CartOut)
-def get_cart_details(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+@router.post("/", response_model=schemas.CartOut)
+async def add_to_cart(
+    payload: schemas.CartCreate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Add products to the user's active cart, creating it if needed."""
+    if payload.user_id is not None and payload.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Cannot add to another user's cart")
+
+    quantities = {}
+    for item in payload.products:
+        if item.quantity < 1:
+            raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    cart_id = await _get_or_create_active_cart(db, current_user.id)
+    if quantities:
+        await _save_items(db, cart_id, quantities, increment=True)
+    await commit_stock(db)
+
+    return json_response(serialize_cart(await _load_cart(db, cart_id)))
+
+
+@router.put("/items/{product_id}", response_model=schemas.CartOut)
+async def set_cart_item(
+    product_id: int,
+    payload: schemas.CartItemUpdate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Set the quantity of one product in the active cart; 0 removes it."""
+    if payload.quantity < 0:
+        raise HTTPException(status_code=400, detail="Quantity cannot be negative")
+
+    cart_id = await _get_or_create_active_cart(db, current_user.id)
+    if payload.quantity == 0:
+        await db.execute(delete(models.CartItem).where(
+            models.CartItem.cart_id == cart_id, models.CartItem.product_id == product_id
+        ))
+        await release_holds(db, cart_id, [product_id])
+    else:
+        await _save_items(db, cart_id, {product_id: payload.quantity}, increment=False)
+    await commit_stock(db)
+
+    return json_response(serialize_cart(await _load_cart(db, cart_id)))
+
+
+@router.delete("/items/{product_id}", response_model=schemas.CartOut)
+async def remove_cart_item(
+    product_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    cart_id = await db.scalar(_active_cart_query(current_user.id))
+    if cart_id is None:
+        raise HTTPException(status_code=404, detail="No active cart found for this user")
+    removed = (await db.execute(delete(models.CartItem).where(
+        models.CartItem.cart_id == cart_id, models.CartItem.product_id == product_id
+    ))).rowcount
+    if not removed:
+        raise HTTPException(status_code=404, detail="Product is not in the cart")
+    await release_holds(db, cart_id, [product_id])
+    await commit_stock(db)
+
+    return json_response(serialize_cart(await _load_cart(db, cart_id)))
+
+
+checkout_adapter = TypeAdapter(schemas.CheckoutOut)
+
+
+@router.post("/checkout/{cart_id}", response_model=schemas.CheckoutOut)
+async def checkout_cart(
+    cart_id: int,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Check out a cart. Retries sent with the same Idempotency-Key get the first response back."""
+    async def checkout():
+        cart = await db.scalar(
+            select(models.Cart).options(CART_ITEMS_WITH_PRODUCTS).where(models.Cart.id == cart_id)
+        )
+        if not cart:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        ensure_user_access(current_user, cart.user_id)
+        if cart.is_checked_out:
+            raise HTTPException(status_code=400, detail="Cart already checked out")
+        order = await place_order(db, cart)
+
+        return {
+            "order_id": order.id,
+            "user_id": order.user_id,
+            "cart_id": order.cart_id,
+            "total_amount": order.total_amount,
+            "order_status": order.order_status,
+            "order_time": order.order_time.isoformat() if order.order_time else None
+        }
+
+    return await idempotent(
+        db, current_user.id, idempotency_key, f"POST /cart/checkout/{cart_id}", checkout, checkout_adapter
+    )
 
-    # Get only the active cart (not checked out)
-    cart = db.query(models.Cart).filter(
+
+@router.get("/user/{user_id}", response_model=schemas.CartOut)
+async def get_cart_details(
+    user_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    ensure_user_access(current_user, user_id)
+
+    cart = await db.scalar(select(models.Cart).options(CART_ITEMS_WITH_PRODUCTS).where(
         models.Cart.user_id == user_id,
         models.Cart.is_checked_out == False
-    ).order_by(models.Cart.created_at.desc()).first()
-    
+    ))
     if not cart:
         raise HTTPException(status_code=404, detail="No active cart found for this user")
 
-    return {
-        "id": cart.id,
-        "user_id": cart.user_id,
-        "created_at": cart.created_at,
-        "products": [
-            {
-                "id": ci.product.id,
-                "name": ci.product.name,
-                "price": ci.product.price,
-                "quantity": ci.quantity,
-                "category": {
-                    "id": ci.product.category.id,
-                    "name": ci.product.category.name,
-                    "description": ci.product.category.description
-                },
-                "stock_status": "Out of Stock" if ci.product.remaining_units == 0 else "Available"
-            }
-            for ci in cart.items
-        ]
-    }
\ No newline at end of file
+    return json_response(serialize_cart(cart))
\ No newline at end of file
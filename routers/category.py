@@ -1,55 +1,103 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from cache import catalog_cache
+from http_cache import conditional_catalog_response
+from serialization import json_response
 import schemas, models
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
 
 
+def serialize_category(category: models.Category):
+    return {"id": category.id, "name": category.name, "description": category.description}
+
+
+async def invalidate_categories():
+    # Bumps the namespace version too, which changes the catalog ETags
+    await catalog_cache.invalidate("categories")
+    # Product listings embed their category
+    await catalog_cache.invalidate("products")
+
+
 @router.post("/", response_model=schemas.CategoryOut)
-def create_category(payload: schemas.CategoryCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.Category).filter(models.Category.name == payload.name).first()
+async def create_category(payload: schemas.CategoryCreate, db: AsyncSession = Depends(get_async_db)):
+    existing = await db.scalar(select(models.Category).where(models.Category.name == payload.name))
     if existing:
         raise HTTPException(status_code=400, detail="Category already exists")
     category = models.Category(name=payload.name, description=payload.description)
     db.add(category)
-    db.commit()
-    db.refresh(category)
+    await db.commit()
+    await catalog_cache.invalidate("categories")
     return category
 
 
 @router.get("/", response_model=list[schemas.CategoryOut])
-def get_categories(db: Session = Depends(get_db)):
-    return db.query(models.Category).all()
+async def get_categories(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    not_modified = await conditional_catalog_response(request, response, "categories")
+    if not_modified:
+        return not_modified
+
+    return json_response(await all_categories(db), response)
+
+
+async def all_categories(db: AsyncSession):
+    async def load():
+        return [serialize_category(c) for c in await db.scalars(select(models.Category))]
+
+    return await catalog_cache.get_or_load("categories", "all", load)
+
+
+async def category_product_counts(db: AsyncSession):
+    """Products per category id, cached with the product listings it describes."""
+    async def load():
+        rows = await db.execute(
+            select(models.Product.category_id, func.count(models.Product.id)).group_by(models.Product.category_id)
+        )
+        # String keys, so the dict survives a JSON round trip through a shared cache backend
+        return {str(category_id): count for category_id, count in rows}
+
+    return await catalog_cache.get_or_load("products", "category_counts", load)
 
 
 @router.get("/{category_id}", response_model=schemas.CategoryOut)
-def get_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(models.Category).get(category_id)
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return category
+async def get_category(
+    category_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    not_modified = await conditional_catalog_response(request, response, "categories")
+    if not_modified:
+        return not_modified
+
+    async def load():
+        category = await db.get(models.Category, category_id)
+        if not category:
+            raise HTTPException(status_code=404, detail="Category not found")
+        return serialize_category(category)
+
+    return json_response(await catalog_cache.get_or_load("categories", category_id, load), response)
 
 
 @router.put("/{category_id}", response_model=schemas.CategoryOut)
-def update_category(category_id: int, payload: schemas.CategoryUpdate, db: Session = Depends(get_db)):
-    category = db.query(models.Category).get(category_id)
+async def update_category(category_id: int, payload: schemas.CategoryUpdate, db: AsyncSession = Depends(get_async_db)):
+    category = await db.get(models.Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     if payload.name:
         category.name = payload.name
     if payload.description:
         category.description = payload.description
-    db.commit()
-    db.refresh(category)
+    await db.commit()
+    await invalidate_categories()
     return category
 
 
 @router.delete("/{category_id}")
-def delete_category(category_id: int, db: Session = Depends(get_db)):
-    category = db.query(models.Category).get(category_id)
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_async_db)):
+    category = await db.get(models.Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    db.delete(category)
-    db.commit()
+    await db.delete(category)
+    await db.commit()
+    await invalidate_categories()
     return {"message": "Category deleted"}
@@ -1,80 +1,69 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from typing import Optional
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, joinedload
+from pydantic import TypeAdapter
+from database import get_async_db
+from checkout import place_order
+from idempotency import idempotent
+from routers.auth import get_current_user, ensure_user_access
+from export import ExportFormat, export_response
 import schemas, models
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
 
-@router.post("/", response_model=schemas.OrderOut)
-def make_order(payload: schemas.OrderCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).get(payload.user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    cart = db.query(models.Cart).get(payload.cart_id)
-    if not cart:
-        raise HTTPException(status_code=404, detail="Cart not found")
-
-    total = sum(item.product.price * item.quantity for item in cart.items)
-    for item in cart.items:
-        if item.product.remaining_units < item.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Not enough stock for {item.product.name}. Only {item.product.remaining_units} left."
-            )
-        item.product.remaining_units -= item.quantity
-
-    # order = models.Order(user_id=user.id, cart_id=cart.id, total_amount=total, order_status="pending")
-    # db.add(order)
-    # db.commit()
-    # db.refresh(order)
-
-    # Create a new cart for this order
-    order_cart = models.Cart(user_id=user.id)
-    db.add(order_cart)
-    db.commit()
-    db.refresh(order_cart)
-
-    # Copy items from the original cart
-    for item in cart.items:
-        order_item = models.CartItem(
-            cart_id=order_cart.id,
-            product_id=item.product_id,
-            quantity=item.quantity
-        )
-        db.add(order_item)
-    db.commit()
-
-    # Create the order linked to the new cart
-    order = models.Order(
-        user_id=user.id,
-        cart_id=order_cart.id,
-        total_amount=total,
-        order_status="confirmed"
-    )
-    db.add(order)
-    db.commit()
-    db.refresh(order)
+order_adapter = TypeAdapter(schemas.OrderOut)
 
 
-    return {
-        "id": order.id,
-        "user_id": order.user_id,
-        "cart_id": order.cart_id,
-        "total_amount": order.total_amount,
-        "order_status": order.order_status,
-        "order_time": order.order_time.isoformat() if order.order_time else None,
-        "user_email": user.email
-    }
+@router.post("/", response_model=schemas.OrderOut)
+async def make_order(
+    payload: schemas.OrderCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Order a cart. Retries sent with the same Idempotency-Key get the first response back."""
+    if payload.user_id is not None and payload.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Cannot order for another user")
+
+    async def order_cart():
+        cart = await db.scalar(select(models.Cart).options(
+            selectinload(models.Cart.items).joinedload(models.CartItem.product)
+        ).where(models.Cart.id == payload.cart_id))
+        if not cart or cart.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Cart not found")
+
+        order = await place_order(db, cart)
+
+        return {
+            "id": order.id,
+            "user_id": order.user_id,
+            "cart_id": order.cart_id,
+            "total_amount": order.total_amount,
+            "order_status": order.order_status,
+            "order_time": order.order_time.isoformat() if order.order_time else None,
+            "user_email": current_user.email
+        }
+
+    return await idempotent(
+        db, current_user.id, idempotency_key, f"POST /orders/ {payload.cart_id}", order_cart, order_adapter
+    )
 
 
 @router.get("/", response_model=schemas.OrderOut)
-def list_orders(db: Session = Depends(get_db)):
+async def list_orders(
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
     # Get only the latest order
-    order = db.query(models.Order).filter (
+    order = await db.scalar(select(models.Order).options(joinedload(models.Order.user)).where(
         models.Order.order_status == "confirmed"
-    ).order_by(models.Order.order_time.desc()).first()
+    ).order_by(models.Order.order_time.desc()).limit(1))
     
     if not order:
         raise HTTPException(status_code=404, detail="No confirmed orders found")
@@ -89,28 +78,142 @@ def list_orders(db: Session = Depends(get_db)):
         "user_email": order.user.email
     }
 
+@router.get("/export")
+async def export_orders(
+    format: ExportFormat = ExportFormat.ndjson,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Every order with its customer's email, streamed in id order. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    query = (
+        select(
+            models.Order.id,
+            models.Order.user_id,
+            models.User.email.label("user_email"),
+            models.Order.cart_id,
+            models.Order.total_amount,
+            models.Order.order_status,
+            models.Order.order_time
+        )
+        .join(models.User, models.Order.user_id == models.User.id)
+        .order_by(models.Order.id)
+    )
+    return export_response(db, query, format, "orders")
+
+
+async def _order_history_page(db: AsyncSession, query, cursor: Optional[int], limit: int):
+    # Keyset pagination, newest first, over the (order_time, id) index. The cursor
+    # is the last order id; its order_time is looked up in SQL so the comparison
+    # uses the stored value exactly as the index holds it.
+    if cursor is not None:
+        cursor_time = select(models.Order.order_time).where(models.Order.id == cursor).scalar_subquery()
+        query = query.where(tuple_(models.Order.order_time, models.Order.id) < tuple_(cursor_time, cursor))
+
+    # One extra row tells whether another page exists
+    orders = (await db.scalars(
+        query.options(joinedload(models.Order.user))
+        .order_by(models.Order.order_time.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+    )).all()
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    # Item lines of the whole page in one query
+    lines = {}
+    if orders:
+        rows = await db.execute(
+            select(
+                models.OrderItem.order_id,
+                models.Product.id,
+                models.Product.name,
+                models.OrderItem.unit_price,
+                models.OrderItem.quantity
+            )
+            .join(models.Product, models.OrderItem.product_id == models.Product.id)
+            .where(models.OrderItem.order_id.in_([order.id for order in orders]))
+            .order_by(models.OrderItem.id)
+        )
+        for order_id, product_id, name, price, quantity in rows:
+            lines.setdefault(order_id, []).append(
+                {"id": product_id, "name": name, "price": price, "quantity": quantity}
+            )
+
+    return {
+        "items": [
+            {
+                "id": order.id,
+                "user_id": order.user_id,
+                "user_email": order.user.email,
+                "cart_id": order.cart_id,
+                "total_amount": order.total_amount,
+                "order_status": order.order_status,
+                "order_time": order.order_time,
+                "products": lines.get(order.id, [])
+            }
+            for order in orders
+        ],
+        "next_cursor": orders[-1].id if has_more else None
+    }
+
+
+@router.get("/history", response_model=schemas.OrderHistoryPage)
+async def order_history(
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    status: str = "confirmed",
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """All orders with the given status, newest first. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    query = select(models.Order).where(models.Order.order_status == status)
+    return await _order_history_page(db, query, cursor, limit)
+
+
+@router.get("/history/{user_id}", response_model=schemas.OrderHistoryPage)
+async def user_order_history(
+    user_id: int,
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """One customer's orders, newest first."""
+    ensure_user_access(current_user, user_id)
+    query = select(models.Order).where(models.Order.user_id == user_id)
+    return await _order_history_page(db, query, cursor, limit)
+
+
 @router.get("/details/{user_id}")
-def get_order_details(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).get(user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+async def get_order_details(
+    user_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    ensure_user_access(current_user, user_id)
 
     # Get only the latest order
-    order = db.query(models.Order).filter(
+    order = await db.scalar(select(models.Order).options(
+        selectinload(models.Order.items).joinedload(models.OrderItem.product)
+    ).where(
         models.Order.user_id == user_id
-    ).order_by(models.Order.order_time.desc()).first()
+    ).order_by(models.Order.order_time.desc()).limit(1))
     
     if not order:
         raise HTTPException(status_code=404, detail="No orders found for this user")
 
     products = [
         {
-            "id": ci.product.id, 
-            "name": ci.product.name, 
-            "price": ci.product.price, 
-            "quantity": ci.quantity
+            "id": line.product.id,
+            "name": line.product.name,
+            "price": line.unit_price,
+            "quantity": line.quantity
         }
-        for ci in order.cart.items
+        for line in order.items
     ]
     
     return {
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from typing import List, Optional
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from pydantic import TypeAdapter
+from database import get_async_db
+from search import search_product_ids
+from cache import catalog_cache
+from http_cache import conditional_catalog_response
+from serialization import dump, json_response
+from export import ExportFormat, export_response
+from bulk_import import import_products
+from reservations import stock_index
+from routers.auth import get_current_user
 import schemas, models
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 
 @router.post("/", response_model=schemas.ProductOut)
-def create_product(payload: schemas.ProductCreate, db: Session = Depends(get_db)):
-    category = db.query(models.Category).get(payload.category_id)
+async def create_product(payload: schemas.ProductCreate, db: AsyncSession = Depends(get_async_db)):
+    category = await db.get(models.Category, payload.category_id)
     if not category:
         raise HTTPException(status_code=400, detail="Category does not exist")
 
@@ -16,44 +28,241 @@ def create_product(payload: schemas.ProductCreate, db: Session = Depends(get_db)
         name=payload.name,
         description=payload.description,
         price=payload.price,
-        category_id=payload.category_id,
+        category=category,
         total_units=payload.total_units,
         remaining_units=payload.remaining_units if payload.remaining_units is not None else payload.total_units,
         quantity=payload.quantity
     )
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await catalog_cache.invalidate("products")
+
+    return json_response(serialize_product(product))
+
+
+@router.post(
+    "/bulk",
+    response_model=schemas.ImportReport,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+        "text/csv": {"schema": {"type": "string"}},
+    }}}
+)
+async def bulk_import_products(
+    request: Request,
+    create_categories: bool = Query(False, description="Create categories given by name that don't exist yet"),
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Import many products from a JSON array, NDJSON or CSV body (picked by Content-Type).
+
+    Each row names its category by ``category`` (name) or ``category_id``; rows
+    with an ``id`` update that product. Invalid rows are skipped and listed in
+    the report with their row number.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return await import_products(request, db, create_categories=create_categories)
+
+
+product_adapter = TypeAdapter(schemas.ProductOut)
+product_list_adapter = TypeAdapter(list[schemas.ProductOut])
+
+
+# Validated once from the ORM rows into plain JSON-compatible dicts, so listings
+# can be cached in any backend and sent without another validation pass.
+def serialize_product(p: models.Product):
+    return dump(product_adapter, p, from_attributes=True)
+
+
+def serialize_products(products):
+    return dump(product_list_adapter, products, from_attributes=True)
+
+
+@router.get("/", response_model=schemas.ProductPage)
+async def list_products(
+    request: Request,
+    response: Response,
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    category_id: Optional[int] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: Optional[bool] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    not_modified = await conditional_catalog_response(request, response, "products")
+    if not_modified:
+        return not_modified
+
+    page = await _cached_product_page(db, cursor, limit, category_id, min_price, max_price, in_stock)
+    return json_response(page, response)
+
+
+async def first_product_page(db: AsyncSession, category_id: Optional[int] = None, limit: int = 50):
+    """The listing's first page, from the same cache entry as ``GET /products/``."""
+    return await _cached_product_page(db, None, limit, category_id, None, None, None)
+
+
+async def _cached_product_page(db, cursor, limit, category_id, min_price, max_price, in_stock):
+    cache_key = f"list:{cursor}:{limit}:{category_id}:{min_price}:{max_price}:{in_stock}"
+
+    async def load():
+        return await _load_product_page(db, cursor, limit, category_id, min_price, max_price, in_stock)
+
+    return await catalog_cache.get_or_load("products", cache_key, load)
+
+
+async def _load_product_page(db, cursor, limit, category_id, min_price, max_price, in_stock):
+    query = select(models.Product).options(joinedload(models.Product.category))
+    if category_id is not None:
+        query = query.where(models.Product.category_id == category_id)
+    if min_price is not None:
+        query = query.where(models.Product.price >= min_price)
+    if max_price is not None:
+        query = query.where(models.Product.price <= max_price)
+    if in_stock is True:
+        query = query.where(models.Product.remaining_units > 0)
+    elif in_stock is False:
+        query = query.where(models.Product.remaining_units <= 0)
+    # Keyset pagination: seek past the last id instead of OFFSET, so every page costs the same
+    if cursor is not None:
+        query = query.where(models.Product.id > cursor)
+
+    # Fetch one extra row to know whether another page exists
+    products = (await db.scalars(query.order_by(models.Product.id).limit(limit + 1))).all()
+    has_more = len(products) > limit
+    products = products[:limit]
 
     return {
-        "id": product.id,
-        "name": product.name,
-        "description": product.description,
-        "price": product.price,
-        "category": schemas.CategoryOut(
-            id=category.id, name=category.name, description=category.description
-        ),
-        "quantity": product.quantity,
-        "stock_status": "Out of Stock" if product.remaining_units == 0 else "Available"
+        "items": serialize_products(products),
+        "next_cursor": products[-1].id if has_more else None
     }
 
 
-@router.get("/", response_model=list[schemas.ProductOut])
-def list_products(db: Session = Depends(get_db)):
-    products = db.query(models.Product).all()
-    result = []
-    for p in products:
-        result.append({
-            "id": p.id,
-            "name": p.name,
-            "description": p.description,
-            "price": p.price,
-            "category": schemas.CategoryOut(
-                id=p.category.id,
-                name=p.category.name,
-                description=p.category.description
-            ),
-            "quantity": p.quantity,
-            "stock_status": "Out of Stock" if p.remaining_units == 0 else "Available"
-        })
-    return result
+@router.get("/availability", response_model=List[schemas.ProductAvailability])
+async def product_availability(
+    ids: List[int] = Query(..., max_length=200, description="Product ids, e.g. ?ids=1&ids=2"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Units still available to add to a cart, served from the in-memory stock index."""
+    available = await stock_index.available(db, ids)
+    return json_response([
+        {"product_id": product_id, "available": units} for product_id, units in available.items()
+    ])
+
+
+@router.get("/search", response_model=schemas.ProductSearchOut)
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    not_modified = await conditional_catalog_response(request, response, "products")
+    if not_modified:
+        return not_modified
+
+    total, ids = await search_product_ids(db, q, limit=limit, offset=(page - 1) * limit)
+
+    # Load the page in one query, then restore the rank order from the index
+    products = {
+        p.id: p
+        for p in await db.scalars(
+            select(models.Product)
+            .options(joinedload(models.Product.category))
+            .where(models.Product.id.in_(ids))
+        )
+    } if ids else {}
+
+    return json_response({
+        "query": q,
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "items": serialize_products([products[i] for i in ids if i in products])
+    }, response)
+
+
+@router.get("/export")
+async def export_products(
+    format: ExportFormat = ExportFormat.ndjson,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """The whole catalog, streamed in id order with flat category columns. Admin only."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    query = (
+        select(
+            models.Product.id,
+            models.Product.name,
+            models.Product.description,
+            models.Product.price,
+            models.Product.quantity,
+            models.Product.total_units,
+            models.Product.remaining_units,
+            models.Product.category_id,
+            models.Category.name.label("category_name")
+        )
+        .join(models.Category, models.Product.category_id == models.Category.id)
+        .order_by(models.Product.id)
+    )
+    return export_response(db, query, format, "products")
+
+
+@router.put("/{product_id}", response_model=schemas.ProductOut)
+async def update_product(
+    product_id: int,
+    payload: schemas.ProductUpdate,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    product = await db.scalar(
+        select(models.Product)
+        .options(joinedload(models.Product.category))
+        .where(models.Product.id == product_id)
+    )
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        if value is not None:
+            setattr(product, field, value)
+    await db.commit()
+    stock_index.forget([product_id])
+    await catalog_cache.invalidate("products")
+    return json_response(serialize_product(product))
+
+
+@router.delete("/{product_id}")
+async def delete_product(
+    product_id: int,
+    current_user: schemas.CurrentUser = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    product = await db.get(models.Product, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    # Order history and stock holds must keep pointing at a real product
+    referenced = await db.scalar(select(
+        exists().where(models.CartItem.product_id == product_id)
+        | exists().where(models.OrderItem.product_id == product_id)
+        | exists().where(models.StockHold.product_id == product_id)
+    ))
+    if referenced:
+        raise HTTPException(status_code=400, detail="Product is referenced by carts, orders or stock holds")
+    await db.delete(product)
+    await db.commit()
+    stock_index.forget([product_id])
+    await catalog_cache.invalidate("products")
+    return {"message": "Product deleted"}
@@ -1,11 +1,10 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
 from typing import Optional, List
 from datetime import datetime
 
 class RegisterIn(BaseModel):
     email: EmailStr
     password: str
-    role: Optional[str] = "user"
 
     class Config:
         from_attributes = True
@@ -25,6 +24,12 @@ class TokenOut(BaseModel):
         from_attributes = True
 
 
+class CurrentUser(BaseModel):
+    id: int
+    email: str
+    role: Optional[str] = "user"
+
+
 class CategoryBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -60,6 +65,7 @@ class ProductUpdate(BaseModel):
     description: Optional[str] = None
     price: Optional[float] = None
     quantity: Optional[int] = None
+    remaining_units: Optional[int] = None
 
 class ProductOut(ProductBase):
     id: int
@@ -70,15 +76,66 @@ class ProductOut(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductPage(BaseModel):
+    items: List[ProductOut]
+    next_cursor: Optional[int] = None
+
+class ProductAvailability(BaseModel):
+    product_id: int
+    available: int
+
+class ProductSearchOut(BaseModel):
+    query: str
+    total: int
+    page: int
+    limit: int
+    items: List[ProductOut]
+
+class ProductImportRow(BaseModel):
+    # Rows with an id update that product (or create it with that id)
+    id: Optional[int] = None
+    name: str
+    description: Optional[str] = None
+    price: float
+    # Either the category name or its id
+    category: Optional[str] = None
+    category_id: Optional[int] = None
+    total_units: int = 0
+    # Defaults to total_units
+    remaining_units: Optional[int] = None
+    quantity: int = 0
+
+    @model_validator(mode="after")
+    def check_category(self):
+        if self.category is None and self.category_id is None:
+            raise ValueError("category or category_id is required")
+        return self
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    received: int
+    imported: int
+    failed: int
+    categories_created: int = 0
+    errors: List[ImportRowError]
+    errors_truncated: bool = False
+
 
 class CartProduct(BaseModel):
     product_id: int
     quantity: int
 
 class CartCreate(BaseModel):
-    user_id: int
+    # Taken from the bearer token; if sent it must match the authenticated user
+    user_id: Optional[int] = None
     products: List[CartProduct]
 
+class CartItemUpdate(BaseModel):
+    quantity: int
+
 class CartOut(BaseModel):
     id: int
     user_id: int
@@ -101,7 +158,7 @@ class CheckoutOut(BaseModel):
         from_attributes = True
 
 class OrderCreate(BaseModel):
-    user_id: int
+    user_id: Optional[int] = None
     cart_id: int
 
 class OrderOut(BaseModel):
@@ -115,3 +172,23 @@ class OrderOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+class OrderLine(BaseModel):
+    id: int
+    name: str
+    price: float
+    quantity: int
+
+class OrderHistoryOut(BaseModel):
+    id: int
+    user_id: int
+    user_email: Optional[str] = None
+    cart_id: int
+    total_amount: float
+    order_status: str
+    order_time: Optional[datetime]
+    products: List[OrderLine]
+
+class OrderHistoryPage(BaseModel):
+    items: List[OrderHistoryOut]
+    next_cursor: Optional[int] = None
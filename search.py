@@ -0,0 +1,102 @@
+import re
+from sqlalchemy import text, or_, select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+
+FTS_TABLE = "products_fts"
+
+# External-content FTS5 index over products.name/description. The triggers keep
+# it in sync with every insert/update/delete, and the update trigger only fires
+# when the indexed columns change so stock updates never touch the index.
+_FTS_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+# bm25 column weights: a hit in the name counts far more than one in the description
+_RANK = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+
+
+def init_search_index(engine):
+    """Create the FTS5 index and its triggers, backfilling it for existing rows."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first()
+        for statement in _FTS_SETUP:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def build_match_query(q: str):
+    """Turn free text into a safe FTS5 query: every word must match, as a prefix."""
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+async def search_product_ids(db: AsyncSession, q: str, limit: int, offset: int):
+    """Return (total_matches, product ids of the requested page in rank order)."""
+    match = build_match_query(q)
+    if match is None:
+        return 0, []
+
+    if db.get_bind().dialect.name != "sqlite":
+        return await _search_product_ids_like(db, q, limit, offset)
+
+    total = await db.scalar(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"),
+        {"match": match}
+    )
+    ids = (await db.execute(
+        text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY {_RANK} LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit, "offset": offset}
+    )).scalars().all()
+    return total, ids
+
+
+async def _search_product_ids_like(db: AsyncSession, q: str, limit: int, offset: int):
+    # Fallback for databases without FTS5: unranked substring match on every word.
+    query = select(models.Product.id)
+    for term in re.findall(r"\w+", q):
+        pattern = f"%{term}%"
+        query = query.where(or_(
+            models.Product.name.ilike(pattern),
+            models.Product.description.ilike(pattern)
+        ))
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    ids = (await db.scalars(query.order_by(models.Product.id).limit(limit).offset(offset))).all()
+    return total, ids
@@ -0,0 +1,60 @@
+"""Production server: several uvicorn worker processes on one port.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+Creates and migrates the schema once, then starts the workers with
+PREPARE_DATABASE off and SHARED_STATE_PATH set to a fresh directory for the
+state they share (see shared_state.py). run.py remains the development
+server: one process, with reload.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+# One worker per core unless set
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count() or 1
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+# Seconds in-flight requests (and running jobs) get to finish on shutdown
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Set before anything reads them, here or in the workers (which inherit the environment)
+    state_dir = tempfile.mkdtemp(prefix="shop-state-")
+    os.environ["SHARED_STATE_PATH"] = state_dir
+    os.environ["PREPARE_DATABASE"] = "false"
+    # Each worker has its own bcrypt process pool; share the cores out instead
+    # of every worker starting one per core
+    os.environ.setdefault("HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    from database import engine
+    from migrations import prepare_database
+    prepare_database(engine)
+    engine.dispose()
+
+    try:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level=args.log_level,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        )
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+# Directory for state shared by the worker processes of one server (set by
+# serve.py). Unset, each process keeps its state to itself, which is all a
+# single-process server needs.
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "")
+
+# (name hash, value); a zero hash marks a free slot
+_SLOT = struct.Struct("<Qq")
+_PROBES = 8
+# One SharedArray element
+_VALUE = struct.Struct("<q")
+
+
+def _hash(name: str):
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little") or 1
+
+
+class _SharedFile:
+    """A memory-mapped file of ``size`` bytes, locked with flock across processes."""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # flock excludes other processes; threads of this one share the lock
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, operation):
+        with self._thread_lock:
+            fcntl.flock(self._fd, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class SharedCounters(_SharedFile):
+    """Named 64-bit counters in a memory-mapped file, shared by every process that opens it.
+
+    A fixed-size hash table; readers and writers take an flock on the file, so
+    an increment in one worker is seen by the next read in any other. When all
+    of a name's probe slots hold other names, the first is reused: a table
+    flooded with names forgets some, and callers must treat a missing counter
+    as new.
+    """
+
+    def __init__(self, path: str, slots: int):
+        super().__init__(path, slots * _SLOT.size)
+        self.slots = slots
+
+    def _probe(self, key: int):
+        for i in range(_PROBES):
+            offset = (key + i) % self.slots * _SLOT.size
+            yield (offset, *_SLOT.unpack_from(self._map, offset))
+
+    def get(self, name: str, default=None):
+        key = _hash(name)
+        with self._locked(fcntl.LOCK_SH):
+            for _, slot_key, value in self._probe(key):
+                if slot_key == key:
+                    return value
+                if slot_key == 0:
+                    break
+        return default
+
+    def add(self, name: str, amount: int = 1, initial: int = 0):
+        """Add ``amount`` (to ``initial`` if the counter is missing) and return the new value."""
+        return self._update(name, lambda value: (initial if value is None else value) + amount)
+
+    def set(self, name: str, value: int):
+        self._update(name, lambda _: value)
+
+    def _update(self, name: str, change):
+        key = _hash(name)
+        with self._locked(fcntl.LOCK_EX):
+            free = None
+            for offset, slot_key, value in self._probe(key):
+                if slot_key == key:
+                    break
+                if slot_key == 0:
+                    free = offset
+                    break
+            else:
+                offset = free = _SLOT.size * (key % self.slots)
+            if free is not None:
+                offset, value = free, None
+            value = change(value)
+            _SLOT.pack_into(self._map, offset, key, value)
+            return value
+
+
+class SharedArray(_SharedFile):
+    """A fixed number of 64-bit counters, by index, shared like SharedCounters but never forgotten."""
+
+    def __init__(self, path: str, length: int):
+        super().__init__(path, length * _VALUE.size)
+        self.length = length
+
+    def get_many(self, indices):
+        with self._locked(fcntl.LOCK_SH):
+            return [_VALUE.unpack_from(self._map, i * _VALUE.size)[0] for i in indices]
+
+    def add_many(self, indices, amount: int = 1):
+        """Add ``amount`` to each index (once per occurrence) and return the new values."""
+        values = []
+        with self._locked(fcntl.LOCK_EX):
+            for i in indices:
+                value = _VALUE.unpack_from(self._map, i * _VALUE.size)[0] + amount
+                _VALUE.pack_into(self._map, i * _VALUE.size, value)
+                values.append(value)
+        return values
+
+
+def shared_counters(name: str, slots: int = 1024):
+    """The counter table ``name`` shared by this server's workers, or None when running alone."""
+    if not SHARED_STATE_PATH:
+        return None
+    return SharedCounters(os.path.join(SHARED_STATE_PATH, f"{name}.counters"), slots)
+
+
+def shared_array(name: str, length: int):
+    """The counter array ``name`` shared by this server's workers, or None when running alone."""
+    if not SHARED_STATE_PATH:
+        return None
+    return SharedArray(os.path.join(SHARED_STATE_PATH, f"{name}.array"), length)
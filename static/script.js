@@ -68,8 +68,7 @@ async function handleRegister(e) {
             },
             body: JSON.stringify({
                 email: email,
-                password: password,
-                role: "user"
+                password: password
             })
         });
 
@@ -135,16 +134,45 @@ async function handleLogin(e) {
     }
 }
 
-// Fetch all products from backend
-async function fetchProducts() {
+// Data the server rendered into the page (see pages.Pages.catalog_response), or null
+function readInitialData() {
+    const element = document.getElementById('initialData');
+    return element ? JSON.parse(element.textContent) : null;
+}
+
+// Fetch one page of products, returns { items, next_cursor }
+// filters: { cursor, limit, category_id, min_price, max_price, in_stock }
+async function fetchProductsPage(filters = {}) {
     try {
-        const response = await fetch(`${API_BASE_URL}/products/`);
+        const params = new URLSearchParams();
+        Object.entries(filters).forEach(([key, value]) => {
+            if (value !== null && value !== undefined) params.append(key, value);
+        });
+        const response = await fetch(`${API_BASE_URL}/products/?${params}`);
         if (!response.ok) throw new Error('Failed to fetch products');
-        const products = await response.json();
-        return products;
+        return await response.json();
     } catch (error) {
         console.error('Error fetching products:', error);
-        return [];
+        return { items: [], next_cursor: null };
+    }
+}
+
+// Fetch products from backend (first page for the given filters)
+async function fetchProducts(filters = {}) {
+    const page = await fetchProductsPage(filters);
+    return page.items;
+}
+
+// Full-text search on the backend, returns { total, items, ... }
+async function fetchSearchResults(query, page = 1, limit = 20) {
+    try {
+        const params = new URLSearchParams({ q: query, page, limit });
+        const response = await fetch(`${API_BASE_URL}/products/search?${params}`);
+        if (!response.ok) throw new Error('Failed to search products');
+        return await response.json();
+    } catch (error) {
+        console.error('Error searching products:', error);
+        return { total: 0, items: [] };
     }
 }
 
@@ -237,21 +265,6 @@ function searchProducts() {
     window.location.href = `/search?q=${encodeURIComponent(searchTerm)}`;
 }
 
-// Change page function
-function changePage(page) {
-    const buttons = document.querySelectorAll('.page-btn');
-    buttons.forEach(btn => btn.classList.remove('active'));
-    
-    if (typeof page === 'number') {
-        buttons[page].classList.add('active');
-        alert(`Loading page ${page}...`);
-    } else if (page === 'prev') {
-        alert('Loading previous page...');
-    } else if (page === 'next') {
-        alert('Loading next page...');
-    }
-}
-
 // Fetch all categories from backend
 async function fetchCategories() {
     try {
@@ -267,7 +280,8 @@ async function fetchCategories() {
 
 // Filter by category
 async function filterByCategory(categoryName) {
-    const allProducts = await fetchProducts();
-    const filtered = allProducts.filter(p => p.category.name === categoryName);
+    const categories = await fetchCategories();
+    const category = categories.find(c => c.name === categoryName);
+    const filtered = category ? await fetchProducts({ category_id: category.id }) : [];
     displayProducts(filtered);
 }
\ No newline at end of file
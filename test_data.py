@@ -1,6 +1,10 @@
+import os
 import requests
 
 API_BASE_URL = "http://127.0.0.1:8000"
+# Bulk import is admin-only: an existing admin account to import as
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@example.com")
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
 
 # Sample Categories
 categories = [
@@ -100,15 +104,24 @@ def add_categories():
 
 def add_products():
     print("\nAdding products...")
-    for prod in products:
-        try:
-            response = requests.post(f"{API_BASE_URL}/products/", json=prod)
-            if response.status_code == 200:
-                print(f"✅ Added product: {prod['name']}")
-            else:
-                print(f"❌ Failed to add {prod['name']}: {response.text}")
-        except Exception as e:
-            print(f"❌ Error: {e}")
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}/auth/login", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}
+        )
+        if response.status_code != 200:
+            print(f"❌ Failed to log in as {ADMIN_EMAIL}: {response.text}")
+            return
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = requests.post(f"{API_BASE_URL}/products/bulk", json=products, headers=headers)
+        if response.status_code == 200:
+            report = response.json()
+            print(f"✅ Added {report['imported']} products")
+            for error in report["errors"]:
+                print(f"❌ Failed to add {products[error['row'] - 1]['name']}: {error['errors']}")
+        else:
+            print(f"❌ Failed to add products: {response.text}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
     print("🚀 Starting to populate database...\n")